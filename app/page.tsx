@@ -14,11 +14,13 @@ import { QuizPanel } from "@/components/quiz-panel"
 export default function HomePage() {
   const [uploadedFile, setUploadedFile] = useState<File | null>(null)
   const [extractedText, setExtractedText] = useState<string>("")
+  const [documentId, setDocumentId] = useState<string | undefined>(undefined)
   const [activeTab, setActiveTab] = useState("upload")
 
-  const handleFileUpload = (file: File, text: string) => {
+  const handleFileUpload = (file: File, text: string, docId?: string) => {
     setUploadedFile(file)
     setExtractedText(text)
+    setDocumentId(docId)
     setActiveTab("summarize")
   }
 
@@ -99,15 +101,15 @@ export default function HomePage() {
           </TabsContent>
 
           <TabsContent value="summarize">
-            <SummarizationPanel text={extractedText} fileName={uploadedFile?.name || ""} />
+            <SummarizationPanel text={extractedText} documentId={documentId} fileName={uploadedFile?.name || ""} />
           </TabsContent>
 
           <TabsContent value="chat">
-            <ChatbotPanel text={extractedText} fileName={uploadedFile?.name || ""} />
+            <ChatbotPanel text={extractedText} documentId={documentId} fileName={uploadedFile?.name || ""} />
           </TabsContent>
 
           <TabsContent value="quiz">
-            <QuizPanel text={extractedText} fileName={uploadedFile?.name || ""} />
+            <QuizPanel text={extractedText} documentId={documentId} fileName={uploadedFile?.name || ""} />
           </TabsContent>
         </Tabs>
       </main>
@@ -0,0 +1,347 @@
+"""Load test for the API against the local stub model.
+
+Starts the server with LLM_BACKEND=stub (or targets --url), drives each
+scenario at every concurrency level and reports latency percentiles,
+time to first chunk, throughput, errors and the server's peak RSS.
+
+    cd backend
+    python -m bench.load_test --concurrency 1,8,32 --requests 200
+    python -m bench.load_test --scenarios chat,quiz --output bench/results.jsonl
+
+Only the standard library is used, so it runs wherever the server does.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Request numbers are unique across levels, so no level is served from an earlier one's cache
+_serial = itertools.count()
+
+_WORDS = (
+    "cell membrane protein energy light chlorophyll glucose enzyme reaction oxygen carbon "
+    "molecule structure function process cycle evidence theory experiment variable result "
+    "system network model history economy market policy culture language memory learning"
+).split()
+
+
+def make_text(words: int, seed: int) -> str:
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(max(1, words // 80)):
+        sentences = []
+        for _ in range(6):
+            sentence = " ".join(rng.choice(_WORDS) for _ in range(13))
+            sentences.append(sentence.capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return f"Study notes {seed}.\n\n" + "\n\n".join(paragraphs)
+
+
+def make_pdf(pages: int, seed: int) -> bytes:
+    """Minimal text PDF, one short paragraph per page"""
+    rng = random.Random(seed)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>")
+    font = 3 + 2 * pages
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>"
+        )
+        lines = [" ".join(rng.choice(_WORDS) for _ in range(10)) for _ in range(20)]
+        body = " ".join(f"({line}) Tj 0 -14 Td" for line in lines)
+        stream = f"BT /F1 11 Tf 72 720 Td (Seed {seed} page {i}) Tj 0 -14 Td {body} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def multipart(field: str, filename: str, content: bytes, content_type: str) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Request:
+    def __init__(self, path: str, body: bytes, content_type: str = "application/json", stream: bool = False):
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+        self.stream = stream
+
+
+def json_request(path: str, payload: dict, stream: bool = False) -> Request:
+    return Request(path, json.dumps(payload).encode(), stream=stream)
+
+
+class Sample:
+    def __init__(self, ok: bool, latency: float, first_chunk: Optional[float], status: int):
+        self.ok = ok
+        self.latency = latency
+        self.first_chunk = first_chunk
+        self.status = status
+
+
+def send(conn: http.client.HTTPConnection, request: Request) -> Sample:
+    start = time.perf_counter()
+    conn.request("POST", request.path, body=request.body, headers={"Content-Type": request.content_type})
+    response = conn.getresponse()
+    first_chunk = None
+    ok = 200 <= response.status < 300
+    if request.stream and ok:
+        # Time to the first streamed model chunk, not just the response headers
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            if line.startswith(b"data:"):
+                event = json.loads(line[5:])
+                if event.get("type") == "error":
+                    ok = False
+                elif first_chunk is None and event.get("type") in ("chunk", "question"):
+                    first_chunk = time.perf_counter() - start
+    else:
+        response.read(1)
+        first_chunk = time.perf_counter() - start
+        response.read()
+    return Sample(ok, time.perf_counter() - start, first_chunk, response.status)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_level(host: str, port: int, build: Callable[[int], Request], concurrency: int, requests: int) -> dict:
+    counter = itertools.count()
+    samples: List[Sample] = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=300)
+        try:
+            while True:
+                if next(counter) >= requests:
+                    return
+                try:
+                    sample = send(conn, build(next(_serial)))
+                except (OSError, http.client.HTTPException, ValueError):
+                    conn.close()
+                    conn = http.client.HTTPConnection(host, port, timeout=300)
+                    sample = Sample(False, 0.0, None, 0)
+                with lock:
+                    samples.append(sample)
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    latencies = [s.latency for s in samples if s.ok]
+    firsts = [s.first_chunk for s in samples if s.ok and s.first_chunk is not None]
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if not s.ok),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "ttfc_p50_ms": _ms(percentile(firsts, 50)),
+        "ttfc_p95_ms": _ms(percentile(firsts, 95)),
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def build_scenarios(host: str, port: int, args) -> Dict[str, Callable[[int], Request]]:
+    # Each request gets its own text, so the response cache and call coalescing do not hide the work
+    run = uuid.uuid4().hex[:8]
+    document = make_text(args.words, seed=0)
+    conn = http.client.HTTPConnection(host, port, timeout=300)
+    body, content_type = multipart("file", "notes.txt", document.encode(), "text/plain")
+    conn.request("POST", "/api/documents/upload", body=body, headers={"Content-Type": content_type})
+    document_id = json.loads(conn.getresponse().read())["document_id"]
+    conn.close()
+
+    def chat(i: int) -> Request:
+        message = f"Explain the role of {_WORDS[i % len(_WORDS)]} in these notes ({run}-{i})"
+        return json_request("/api/chat/message/stream", {"content": message, "document_id": document_id}, stream=True)
+
+    def upload(i: int) -> Request:
+        body, content_type = multipart("file", f"notes-{i}.pdf", make_pdf(args.pages, seed=hash((run, i))), "application/pdf")
+        return Request("/api/documents/upload", body, content_type)
+
+    def summarize(i: int) -> Request:
+        return json_request("/api/documents/summarize", {"text": f"Run {run}-{i}.\n\n{document}"})
+
+    def quiz(i: int) -> Request:
+        return json_request("/api/quiz/generate", {"text": f"Run {run}-{i}.\n\n{document}", "num_questions": args.questions})
+
+    return {"chat": chat, "upload": upload, "summarize": summarize, "quiz": quiz}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, args, data_dir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": "stub",
+        "STUB_LATENCY_SECONDS": str(args.stub_latency),
+        "STUB_CHUNK_DELAY": str(args.stub_chunk_delay),
+        "STUB_ERROR_RATE": str(args.stub_error_rate),
+        # Quota pacing is for the real API; it would only measure the bucket here
+        "LLM_RPM": "0",
+        "LLM_TPM": "0",
+        "QUIZ_DB_PATH": os.path.join(data_dir, "quizzes.db"),
+        "JOBS_DB_PATH": os.path.join(data_dir, "jobs.db"),
+        "DOCUMENT_DB_PATH": os.path.join(data_dir, "documents.db"),
+    })
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Server did not become healthy within 30s")
+
+
+def peak_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """High-water resident set size of the server process (Linux only)"""
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="benchmark a running server instead of starting one with the stub backend")
+    parser.add_argument("--pid", type=int, help="server pid for RSS when using --url")
+    parser.add_argument("--scenarios", default="chat,upload,summarize,quiz")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--words", type=int, default=3000, help="size of the generated study text")
+    parser.add_argument("--pages", type=int, default=20, help="pages per uploaded PDF")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--stub-latency", type=float, default=0.2)
+    parser.add_argument("--stub-chunk-delay", type=float, default=0.02)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="append results as JSON lines, for tracking runs over time")
+    args = parser.parse_args()
+
+    server = None
+    data_dir = tempfile.mkdtemp(prefix="bench-")
+    if args.url:
+        target = urlparse(args.url)
+        host, port, pid = target.hostname, target.port or 80, args.pid
+    else:
+        host, port = "127.0.0.1", free_port()
+        server = start_server(port, args, data_dir)
+        pid = server.pid
+
+    try:
+        scenarios = build_scenarios(host, port, args)
+        levels = [int(level) for level in args.concurrency.split(",")]
+        results = []
+        print(f"{'scenario':<10} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50':>8} {'p95':>8} "
+              f"{'p99':>8} {'ttfc50':>8} {'ttfc95':>8} {'rss MB':>7}")
+        for name in args.scenarios.split(","):
+            for concurrency in levels:
+                result = run_level(host, port, scenarios[name], concurrency, args.requests)
+                result.update({"scenario": name, "peak_rss_mb": peak_rss_mb(pid)})
+                results.append(result)
+                print(f"{name:<10} {concurrency:>5} {result['requests']:>5} {result['errors']:>4} "
+                      + " ".join(f"{_fmt(result[k]):>8}" for k in ("rps", "p50_ms", "p95_ms", "p99_ms", "ttfc_p50_ms", "ttfc_p95_ms"))
+                      + f" {_fmt(result['peak_rss_mb']):>7}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        run = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "stub": {"latency": args.stub_latency, "chunk_delay": args.stub_chunk_delay, "error_rate": args.stub_error_rate},
+        }
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({**run, **result}) + "\n")
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else str(value)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Cold-start benchmark: import time, time to first request and worker memory.
+
+Each run starts a fresh server (stub backend unless --backend gemini) and
+measures how long `import main` takes, how long until /health answers, the
+latency of the first upload and first summary, and the resident memory of
+the API process and of its PDF workers once those requests are done.
+
+    cd backend
+    python -m bench.startup --runs 5
+    python -m bench.startup --no-warmup --output bench/startup.jsonl
+
+Only the standard library is used, so it runs wherever the server does.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from bench.load_test import BACKEND_DIR, free_port, git_revision, make_pdf, make_text, multipart, percentile, _fmt, _ms
+
+_IMPORT_SCRIPT = (
+    "import resource, time\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+
+
+def server_env(args, data_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": args.backend,
+        "STUB_LATENCY_SECONDS": "0",
+        "STUB_CHUNK_DELAY": "0",
+        "WARMUP_ON_STARTUP": "false" if args.no_warmup else "true",
+        "QUIZ_DB_PATH": os.path.join(data_dir, "quizzes.db"),
+        "JOBS_DB_PATH": os.path.join(data_dir, "jobs.db"),
+        "DOCUMENT_DB_PATH": os.path.join(data_dir, "documents.db"),
+    })
+    return env
+
+
+def measure_import(env: dict) -> tuple:
+    """Seconds to import the app and the peak RSS in MB of a bare interpreter doing so"""
+    output = subprocess.check_output([sys.executable, "-c", _IMPORT_SCRIPT], cwd=BACKEND_DIR, env=env, text=True)
+    seconds, max_rss_kb = output.split()
+    return float(seconds), round(int(max_rss_kb) / 1024, 1)
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid: int) -> List[int]:
+    """All descendants of pid (Linux only), e.g. the forkserver and PDF workers"""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        return []
+    return children + [grandchild for child in children for grandchild in child_pids(child)]
+
+
+def timed_post(port: int, path: str, body: bytes, content_type: str) -> Optional[float]:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        start = time.perf_counter()
+        conn.request("POST", path, body=body, headers={"Content-Type": content_type})
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - start if response.status == 200 else None
+    finally:
+        conn.close()
+
+
+def run_once(args, run: int) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    env = server_env(args, data_dir)
+    import_seconds, import_rss = measure_import(env)
+
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    try:
+        ready = None
+        while time.perf_counter() - start < 60:
+            if server.poll() is not None:
+                raise RuntimeError("Server exited during startup")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/health")
+                if conn.getresponse().status == 200:
+                    ready = time.perf_counter() - start
+                    break
+            except OSError:
+                time.sleep(0.01)
+        if ready is None:
+            raise RuntimeError("Server did not become healthy within 60s")
+        idle_rss = rss_mb(server.pid)
+
+        if args.settle:
+            # Give the background warm-up time to finish, as it would between deploy and first user
+            time.sleep(args.settle)
+        body, content_type = multipart("file", f"cold-{run}.pdf", make_pdf(args.pages, seed=run), "application/pdf")
+        first_upload = timed_post(port, "/api/documents/upload", body, content_type)
+        payload = json.dumps({"text": make_text(400, seed=run)}).encode()
+        first_summary = timed_post(port, "/api/documents/summarize", payload, "application/json")
+
+        children = child_pids(server.pid)
+        return {
+            "import_ms": _ms(import_seconds),
+            "import_rss_mb": import_rss,
+            "ready_ms": _ms(ready),
+            "first_upload_ms": _ms(first_upload),
+            "first_summary_ms": _ms(first_summary),
+            "idle_rss_mb": idle_rss,
+            "api_rss_mb": rss_mb(server.pid),
+            "workers_rss_mb": round(sum(rss_mb(pid) or 0 for pid in children), 1),
+            "processes": 1 + len(children),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", default="stub", help="model backend; gemini needs GEMINI_API_KEY")
+    parser.add_argument("--no-warmup", action="store_true", help="start with WARMUP_ON_STARTUP=false")
+    parser.add_argument("--settle", type=float, default=0.0, help="seconds to wait after startup before the first request")
+    parser.add_argument("--pages", type=int, default=5, help="pages in the first uploaded PDF")
+    parser.add_argument("--output", help="append the summary as a JSON line, for tracking runs over time")
+    args = parser.parse_args()
+
+    columns = ("import_ms", "import_rss_mb", "ready_ms", "first_upload_ms", "first_summary_ms",
+               "idle_rss_mb", "api_rss_mb", "workers_rss_mb", "processes")
+    print(f"{'run':<4} " + " ".join(f"{name:>16}" for name in columns))
+    results = []
+    for run in range(args.runs):
+        result = run_once(args, run)
+        results.append(result)
+        print(f"{run:<4} " + " ".join(f"{_fmt(result[name]):>16}" for name in columns))
+
+    summary = {
+        name: percentile([r[name] for r in results if r[name] is not None], 50) for name in columns
+    }
+    print(f"{'p50':<4} " + " ".join(f"{_fmt(summary[name]):>16}" for name in columns))
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "revision": git_revision(),
+                "backend": args.backend,
+                "warmup": not args.no_warmup,
+                "runs": args.runs,
+                **summary,
+            }) + "\n")
+
+
+if __name__ == "__main__":
+    main()
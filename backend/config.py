@@ -1,9 +1,128 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    GEMINI_API_KEY: str
+    GEMINI_API_KEY: str = ""  # required unless LLM_BACKEND=stub
     CORS_ORIGINS: str = "http://localhost:3000"
     MODEL_NAME: str = "gemini-pro"
+    # Prompt budget in tokens: the model's context window minus room reserved for the answer
+    MODEL_CONTEXT_WINDOW: int = 32768
+    MAX_OUTPUT_TOKENS: int = 2048
+
+    # Retrieval: uploaded documents are chunked and indexed so chat only sends relevant chunks
+    CHUNK_SIZE: int = 1200
+    CHUNK_OVERLAP: int = 200
+    RETRIEVAL_TOP_K: int = 5
+    MAX_INDEXED_DOCUMENTS: int = 100
+    EMBEDDING_MODEL: Optional[str] = None  # e.g. "models/embedding-001"; BM25 only when unset
+    EMBEDDING_BATCH_SIZE: int = 100  # texts per embedding request (the API's batch limit)
+
+    # Model backend: "gemini", or "stub" for a deterministic local model (no API key or quota used)
+    LLM_BACKEND: str = "gemini"
+    STUB_LATENCY_SECONDS: float = 0.2  # time to first chunk
+    STUB_CHUNK_DELAY: float = 0.02
+    STUB_CHUNK_CHARS: int = 40
+    STUB_ERROR_RATE: float = 0.0
+    STUB_SEED: int = 0
+
+    # Shared LLM client: one worker pool and a global cap on concurrent upstream calls
+    LLM_MAX_WORKERS: int = 8
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_COALESCE: bool = True  # share one upstream call between identical concurrent prompts
+
+    # Upstream resilience: set LLM_RPM/LLM_TPM to your API quota (0 disables a limit)
+    LLM_RPM: int = 60
+    LLM_TPM: int = 120000
+    LLM_QUEUE_TIMEOUT: float = 30.0  # longest a call waits for quota before a 503
+    LLM_TIMEOUT_SECONDS: float = 60.0  # per attempt; for streams, the longest gap between chunks
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 8.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30.0
+
+    # Chat sessions: older turns are summarized once the history passes CHAT_HISTORY_TOKENS
+    MAX_CHAT_SESSIONS: int = 1000
+    CHAT_SESSION_TTL_SECONDS: float = 2 * 3600
+    CHAT_HISTORY_TOKENS: int = 1500
+    CHAT_KEEP_RECENT_TURNS: int = 4
+
+    # Response cache for summaries and quizzes; the SQLite tier is off unless a path is set
+    CACHE_MAX_ENTRIES: int = 512
+    CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    CACHE_DB_PATH: Optional[str] = None
+
+    # Upload extraction limits; PDFs are parsed in page batches in a process pool
+    MAX_UPLOAD_BYTES: int = 50 * 1024 * 1024
+    MAX_PDF_PAGES: int = 1000
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    PDF_PAGE_BATCH: int = 16
+    PDF_WORKERS: int = 2
+
+    # OCR fallback for scanned PDFs: image-only pages are recognized in their own process pool.
+    # Needs pytesseract, Pillow and the tesseract binary; "none" turns it off
+    OCR_ENGINE: str = "tesseract"
+    OCR_LANGUAGE: str = "eng"
+    OCR_WORKERS: int = 1
+    OCR_MAX_PAGES: int = 200  # per document
+    OCR_MIN_PAGE_CHARS: int = 20  # pages with less extracted text are treated as image-only
+
+    # Load the model client and start a PDF worker in the background right after startup
+    WARMUP_ON_STARTUP: bool = True
+
+    # Document store: extracted text, zlib-compressed on disk, with an in-memory LRU of recent texts
+    DOCUMENT_DB_PATH: str = "data/documents.db"
+    DOCUMENT_CACHE_CHARS: int = 64 * 1024 * 1024
+    DOCUMENT_TTL_SECONDS: float = 30 * 24 * 3600  # since last use
+
+    # Map-reduce summarization for documents larger than one prompt (sizes in estimated tokens)
+    SUMMARY_SINGLE_PASS_TOKENS: int = 24000
+    SUMMARY_SECTION_TOKENS: int = 6000
+    SUMMARY_FANOUT: int = 4
+
+    # Re-requests for missing or invalid quiz questions before giving up
+    QUIZ_REPAIR_ATTEMPTS: int = 2
+    # Larger quizzes are split across document sections and generated in parallel
+    QUIZ_QUESTIONS_PER_CALL: int = 8
+    QUIZ_FANOUT: int = 4
+    QUIZ_MAX_QUESTIONS: int = 50  # per quiz request
+
+    # Quiz storage: "sqlite" (shared across workers) or "memory" (single process)
+    QUIZ_STORE: str = "sqlite"
+    QUIZ_DB_PATH: str = "data/quizzes.db"
+    QUIZ_TTL_SECONDS: float = 7 * 24 * 3600
+    QUIZ_CACHE_SIZE: int = 1000
+
+    # Study packs: upload with study_pack=true to precompute the summary and a question bank
+    STUDY_PACK_QUESTIONS: int = 40
+    STUDY_PACK_WORKERS: int = 2
+    # A stage that fails on a rate limit or model outage is retried, waiting STUDY_PACK_RETRY_DELAY doubled each time
+    STUDY_PACK_RETRIES: int = 5
+    STUDY_PACK_RETRY_DELAY: float = 10.0
+
+    # Batch endpoints: items of one batch run BATCH_CONCURRENCY at a time, and all
+    # batches share BATCH_MAX_ITEMS item slots so concurrent batches take turns
+    BATCH_MAX_DOCUMENTS: int = 50
+    BATCH_CONCURRENCY: int = 4
+    BATCH_MAX_ITEMS: int = 8
+
+    # Background jobs for quiz and summary generation
+    JOBS_DB_PATH: str = "data/jobs.db"
+    JOB_WORKERS: int = 4
+    JOB_RETENTION_SECONDS: float = 24 * 3600
+    JOB_EVENT_HEARTBEAT: float = 15.0
+    # Server processes share the job file; a running job whose process has sent no
+    # heartbeat for this long is taken over by another process
+    JOB_LEASE_SECONDS: float = 60.0
+
+    # Streaming: bounded in-flight streams and per-stream chunk buffer
+    MAX_CONCURRENT_STREAMS: int = 8
+    STREAM_QUEUE_SIZE: int = 32
+    STREAM_SLOT_TIMEOUT: float = 30.0
+
+    # Observability: send an X-Debug-Timing header to get a Server-Timing breakdown back
+    DEBUG_TIMING: bool = False
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,41 @@
+from fastapi import Request
+from services.batch_service import BatchService
+from services.chat_service import ChatService
+from services.document_service import DocumentService
+from services.document_store import DocumentStore
+from services.quiz_service import QuizService
+from services.retrieval_service import RetrievalService
+from services.job_service import JobService
+from services.study_pack import StudyPackService
+
+
+def get_chat_service(request: Request) -> ChatService:
+    return request.app.state.chat_service
+
+
+def get_document_service(request: Request) -> DocumentService:
+    return request.app.state.document_service
+
+
+def get_document_store(request: Request) -> DocumentStore:
+    return request.app.state.document_store
+
+
+def get_quiz_service(request: Request) -> QuizService:
+    return request.app.state.quiz_service
+
+
+def get_retrieval_service(request: Request) -> RetrievalService:
+    return request.app.state.retrieval_service
+
+
+def get_batch_service(request: Request) -> BatchService:
+    return request.app.state.batch_service
+
+
+def get_study_pack_service(request: Request) -> StudyPackService:
+    return request.app.state.study_pack_service
+
+
+def get_job_service(request: Request) -> JobService:
+    return request.app.state.job_service
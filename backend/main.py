@@ -1,9 +1,94 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import documents, chat, quiz
+from routers import documents, chat, quiz, jobs, batch
 from config import settings
+from middleware import PromptTokensMiddleware, RequestMetricsMiddleware, PROMPT_TOKENS_HEADER, SERVER_TIMING_HEADER
+from services import metrics, pdf_extraction
+from services.gemini_service import GeminiService
+from services.retrieval_service import RetrievalService
+from services.chat_service import ChatService
+from services.session_service import SessionService
+from services.document_service import DocumentService
+from services.document_store import DocumentStore
+from services.quiz_service import QuizService
+from services.cache import ResponseCache
+from services.quiz_repository import create_quiz_repository
+from services.job_service import JobStore, JobService, register_study_handlers
+from services.batch_service import BatchService
+from services.ocr import create_ocr_service
+from services.study_pack import StudyPackStore, StudyPackService
 
-app = FastAPI(title="AI Study Assistant API", version="1.0.0")
+async def warm_up(gemini: GeminiService, document_service: DocumentService) -> None:
+    """Pay the first-request costs (model SDK import, PDF worker start) before traffic arrives"""
+    started = time.perf_counter()
+    results = await asyncio.gather(gemini.warm_up(), document_service.warm_up(), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Warm-up step failed: {str(result)}")
+    metrics.record_stage("warmup", time.perf_counter() - started)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One LLM client (worker pool + global concurrency cap) shared by every service
+    gemini = GeminiService()
+    document_store = DocumentStore()
+    document_store.purge_expired()
+    retrieval = RetrievalService(
+        embedder=gemini.embed_texts if settings.EMBEDDING_MODEL else None,
+        loader=document_store.get_text,
+    )
+    cache = ResponseCache()
+    cache.purge_expired()
+    pdf_pool = pdf_extraction.create_pool(settings.PDF_WORKERS)
+    app.state.gemini = gemini
+    app.state.retrieval_service = retrieval
+    app.state.document_store = document_store
+    app.state.response_cache = cache
+    sessions = SessionService(gemini)
+    app.state.chat_service = ChatService(gemini, retrieval, sessions)
+    ocr = create_ocr_service(cache)
+    app.state.ocr_service = ocr
+    app.state.document_service = DocumentService(gemini, cache, pdf_pool, document_store, ocr)
+    quiz_repository = create_quiz_repository()
+    quiz_repository.purge_expired()
+    app.state.quiz_service = QuizService(gemini, cache, quiz_repository)
+    app.state.batch_service = BatchService(
+        app.state.document_service, app.state.quiz_service, retrieval, document_store
+    )
+    study_packs = StudyPackService(
+        StudyPackStore(), document_store, app.state.document_service, app.state.quiz_service, retrieval
+    )
+    study_packs.start()
+    app.state.study_pack_service = study_packs
+    job_service = JobService(JobStore())
+    register_study_handlers(job_service, app.state.quiz_service, app.state.document_service)
+    job_service.start()
+    app.state.job_service = job_service
+    # In the background, so the server starts accepting requests straight away
+    warmup = asyncio.create_task(warm_up(gemini, app.state.document_service)) if settings.WARMUP_ON_STARTUP else None
+    try:
+        yield
+    finally:
+        if warmup:
+            warmup.cancel()
+        await job_service.stop()
+        await study_packs.stop()
+        await sessions.close()
+        job_service.store.close()
+        gemini.shutdown()
+        pdf_pool.shutdown(wait=False, cancel_futures=True)
+        if ocr:
+            ocr.shutdown()
+        cache.close()
+        quiz_repository.close()
+        study_packs.close()
+        document_store.close()
+
+app = FastAPI(title="AI Study Assistant API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS with environment variable
 cors_origins = settings.CORS_ORIGINS.split(",")
@@ -13,12 +98,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[PROMPT_TOKENS_HEADER, SERVER_TIMING_HEADER],
 )
+app.add_middleware(PromptTokensMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 # Include routers
 app.include_router(documents.router, prefix="/api/documents", tags=["documents"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 app.include_router(quiz.router, prefix="/api/quiz", tags=["quiz"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(batch.router, prefix="/api/batch", tags=["batch"])
 
 @app.get("/")
 async def root():
@@ -28,6 +118,26 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "AI Study Assistant API"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return app.state.response_cache.stats()
+
+@app.get("/documents/stats")
+async def document_stats():
+    stats = app.state.document_store.stats()
+    stats["study_packs"] = app.state.study_pack_service.stats()
+    if app.state.ocr_service:
+        stats["ocr"] = app.state.ocr_service.stats()
+    return stats
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return app.state.gemini.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=settings.PORT, reload=True)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import settings
+from services import metrics
+from services.prompt_budget import start_request_tracking
+
+PROMPT_TOKENS_HEADER = "X-Prompt-Tokens"
+DEBUG_TIMING_HEADER = "X-Debug-Timing"
+SERVER_TIMING_HEADER = "Server-Timing"
+
+
+class PromptTokensMiddleware:
+    """Reports the estimated prompt tokens a request sent upstream in an X-Prompt-Tokens header"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        holder = start_request_tracking()
+
+        async def send_with_tokens(message: Message) -> None:
+            if message["type"] == "http.response.start" and holder[0]:
+                headers = list(message.get("headers", []))
+                headers.append((PROMPT_TOKENS_HEADER.lower().encode(), str(holder[0]).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_tokens)
+
+
+class RequestMetricsMiddleware:
+    """Records request count, latency and in-flight gauges per route.
+
+    With DEBUG_TIMING enabled, a request sent with an X-Debug-Timing header
+    gets a Server-Timing header breaking its time down by stage. Stages still
+    running when the headers go out (the body of a stream) are not included.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stages = metrics.start_request_timing()
+        debug = settings.DEBUG_TIMING and any(
+            name == DEBUG_TIMING_HEADER.lower().encode() for name, _ in scope.get("headers", [])
+        )
+        metrics.HTTP_IN_FLIGHT.inc()
+
+        async def send_with_metrics(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                # Route templates, not raw paths, keep label cardinality bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                method = scope["method"]
+                metrics.HTTP_LATENCY.observe(elapsed, method=method, route=route)
+                metrics.HTTP_REQUESTS.inc(method=method, route=route, status=str(message["status"]))
+                if debug:
+                    timing = metrics.server_timing(stages + [("total", elapsed)])
+                    headers = list(message.get("headers", []))
+                    headers.append((SERVER_TIMING_HEADER.lower().encode(), timing.encode()))
+                    message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
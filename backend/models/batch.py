@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import List
+from config import settings
+
+class BatchSummarizeRequest(BaseModel):
+    document_ids: List[str]
+    course_summary: bool = False  # also summarize the whole batch from the per-document summaries
+    fresh: bool = False  # bypass the response cache
+
+class BatchQuizRequest(BaseModel):
+    document_ids: List[str]
+    num_questions: int = Field(5, ge=1, le=settings.QUIZ_MAX_QUESTIONS)
+    fresh: bool = False  # bypass the response cache and generate new questions
@@ -1,10 +1,30 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from config import settings
 
 class ChatMessage(BaseModel):
     content: str
-    context: str
+    context: Optional[str] = None
+    document_id: Optional[str] = None
+    # Chunks to retrieve; defaults to RETRIEVAL_TOP_K and is capped so the prompt stays bounded
+    top_k: Optional[int] = Field(None, ge=1, le=settings.RETRIEVAL_TOP_K * 4)
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     content: str
 
+class SessionCreateRequest(BaseModel):
+    document_id: Optional[str] = None
+    context: Optional[str] = None
+
+class ChatTurn(BaseModel):
+    question: str
+    answer: str
+
+class SessionInfo(BaseModel):
+    session_id: str
+    document_id: str
+    summary: str
+    turns: List[ChatTurn]
+    history_tokens: int
+
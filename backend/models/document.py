@@ -1,9 +1,19 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class DocumentSummary(BaseModel):
     quick_notes: List[str]
     key_takeaways: List[str]
 
 class SummarizeRequest(BaseModel):
-    text: str
\ No newline at end of file
+    text: Optional[str] = None
+    document_id: Optional[str] = None  # a stored upload, instead of sending the text
+    fresh: bool = False  # bypass the response cache
+
+class StudyPackStatus(BaseModel):
+    document_id: str
+    status: str  # building or ready
+    summary_ready: bool
+    questions: int  # in the bank so far
+    questions_target: int
+    questions_served: int
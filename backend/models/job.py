@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: str
+    deduplicated: bool = False
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued, running, succeeded or failed
+    progress: float
+    message: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+class JobResult(BaseModel):
+    id: str
+    status: str
+    result: Any
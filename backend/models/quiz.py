@@ -1,9 +1,12 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+from config import settings
 
 class QuizRequest(BaseModel):
-    text: str
-    num_questions: int = 5
+    text: Optional[str] = None
+    document_id: Optional[str] = None  # a stored upload, instead of sending the text
+    num_questions: int = Field(5, ge=1, le=settings.QUIZ_MAX_QUESTIONS)
+    fresh: bool = False  # bypass the response cache and generate new questions
 
 class Question(BaseModel):
     id: str
@@ -18,4 +21,35 @@ class Quiz(BaseModel):
 
 class AnswerResult(BaseModel):
     correct: bool
-    explanation: str
\ No newline at end of file
+    explanation: str
+
+class AnswerSubmission(BaseModel):
+    question_id: str
+    answer: int
+
+class BatchAnswerRequest(BaseModel):
+    quiz_id: str
+    answers: List[AnswerSubmission]
+
+    @field_validator("answers")
+    @classmethod
+    def answer_each_question_once(cls, answers: List[AnswerSubmission]) -> List[AnswerSubmission]:
+        # Each question counts once, so the score can never exceed the total
+        seen = set()
+        for submission in answers:
+            if submission.question_id in seen:
+                raise ValueError(f"Question answered more than once: {submission.question_id}")
+            seen.add(submission.question_id)
+        return answers
+
+class QuestionResult(BaseModel):
+    question_id: str
+    correct: bool
+    correct_answer: int
+    explanation: str
+
+class BatchAnswerResult(BaseModel):
+    quiz_id: str
+    score: int
+    total: int
+    results: List[QuestionResult]
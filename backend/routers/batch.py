@@ -0,0 +1,76 @@
+from fastapi import APIRouter, UploadFile, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+import json
+from typing import AsyncGenerator, List, Literal
+from models.batch import BatchSummarizeRequest, BatchQuizRequest
+from services.batch_service import BatchService
+from dependencies import get_batch_service
+
+router = APIRouter()
+
+# Results stream back one event per document as each finishes: Server-Sent Events
+# by default, or newline-delimited JSON with ?format=ndjson
+StreamFormat = Literal["sse", "ndjson"]
+
+
+def _stream(events: AsyncGenerator[dict, None], format: StreamFormat) -> StreamingResponse:
+    async def generate_stream():
+        async for event in events:
+            if format == "ndjson":
+                yield json.dumps(event) + "\n"
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="application/x-ndjson" if format == "ndjson" else "text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
+def _check_size(count: int) -> None:
+    try:
+        BatchService.check_size(count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/upload")
+async def upload_documents(
+    files: List[UploadFile],
+    format: StreamFormat = "sse",
+    batch_service: BatchService = Depends(get_batch_service),
+):
+    """Extract and store many documents in parallel; each event carries one file's document_id"""
+    _check_size(len(files))
+    uploads = await batch_service.spool_uploads(files)
+    return _stream(batch_service.stream_uploads(uploads), format)
+
+
+@router.post("/summarize")
+async def summarize_documents(
+    request: BatchSummarizeRequest,
+    format: StreamFormat = "sse",
+    batch_service: BatchService = Depends(get_batch_service),
+):
+    """Summarize stored documents, streaming each summary as it finishes"""
+    _check_size(len(request.document_ids))
+    return _stream(
+        batch_service.stream_summaries(request.document_ids, request.fresh, request.course_summary), format
+    )
+
+
+@router.post("/quiz")
+async def generate_quizzes(
+    request: BatchQuizRequest,
+    format: StreamFormat = "sse",
+    batch_service: BatchService = Depends(get_batch_service),
+):
+    """Generate one quiz per stored document, streaming each quiz as it is ready"""
+    _check_size(len(request.document_ids))
+    return _stream(
+        batch_service.stream_quizzes(request.document_ids, request.num_questions, request.fresh), format
+    )
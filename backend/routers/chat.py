@@ -1,27 +1,58 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
-from models.chat import ChatMessage, ChatResponse
+from models.chat import ChatMessage, ChatResponse, SessionCreateRequest, SessionInfo, ChatTurn
 from services.chat_service import ChatService
+from dependencies import get_chat_service
 import json
+import time
+from services import metrics
 
 router = APIRouter()
-chat_service = ChatService()
 
 @router.post("/message")
-async def send_message(message: ChatMessage):
+async def send_message(message: ChatMessage, chat_service: ChatService = Depends(get_chat_service)):
     try:
-        response = await chat_service.generate_response(message.content, message.context)
+        response = await chat_service.generate_response(
+            message.content, message.context, message.document_id, message.top_k, message.session_id
+        )
         return ChatResponse(content=response)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/message/stream")
-async def send_message_stream(message: ChatMessage):
+async def send_message_stream(message: ChatMessage, chat_service: ChatService = Depends(get_chat_service)):
     """Stream chat response using Server-Sent Events"""
+    started = time.perf_counter()
+    stream = chat_service.generate_response_stream(
+        message.content, message.context, message.document_id, message.top_k, message.session_id
+    )
+    # Wait for the first chunk so an oversized or invalid request gets a real status code
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except HTTPException:
+        await stream.aclose()
+        raise
+    except ValueError as e:
+        await stream.aclose()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await stream.aclose()
+        raise HTTPException(status_code=500, detail=str(e))
+    if first is not None:
+        metrics.STREAM_FIRST_CHUNK.observe(time.perf_counter() - started, endpoint="chat")
+
     try:
         async def generate_stream():
             try:
-                async for chunk in chat_service.generate_response_stream(message.content, message.context):
+                if first is not None:
+                    yield f"data: {json.dumps({'type': 'chunk', 'content': first})}\n\n"
+                async for chunk in stream:
                     # Format as Server-Sent Events
                     yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
                 
@@ -31,6 +62,9 @@ async def send_message_stream(message: ChatMessage):
             except Exception as e:
                 # Send error signal
                 yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            finally:
+                # Runs on client disconnect too, releasing the upstream stream
+                await stream.aclose()
 
         return StreamingResponse(
             generate_stream(),
@@ -46,3 +80,33 @@ async def send_message_stream(message: ChatMessage):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/sessions")
+async def create_session(request: SessionCreateRequest, chat_service: ChatService = Depends(get_chat_service)):
+    """Start a server-side conversation; later messages only need the session_id"""
+    try:
+        session_id = await chat_service.create_session(request.document_id, request.context)
+        return {"session_id": session_id}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/sessions/{session_id}", response_model=SessionInfo)
+async def get_session(session_id: str, chat_service: ChatService = Depends(get_chat_service)):
+    try:
+        session = chat_service.sessions.get(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return SessionInfo(
+        session_id=session.id,
+        document_id=session.document_id,
+        summary=session.summary,
+        turns=[ChatTurn(question=q, answer=a) for q, a in session.turns],
+        history_tokens=session.history_tokens(),
+    )
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, chat_service: ChatService = Depends(get_chat_service)):
+    try:
+        chat_service.sessions.delete(session_id)
+        return {"deleted": True}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
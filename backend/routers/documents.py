@@ -1,23 +1,158 @@
-from fastapi import APIRouter, UploadFile, HTTPException, Body
+from fastapi import APIRouter, UploadFile, HTTPException, Body, Depends
+from fastapi.responses import StreamingResponse
+import hashlib
+import json
+import os
+import time
 from services.document_service import DocumentService
-from models.document import DocumentSummary, SummarizeRequest
+from services.document_store import DocumentStore
+from services.retrieval_service import RetrievalService
+from services.study_pack import StudyPackService
+from models.document import DocumentSummary, SummarizeRequest, StudyPackStatus
+from dependencies import get_document_service, get_document_store, get_retrieval_service, get_study_pack_service
+from services import metrics
+from config import settings
 
 router = APIRouter()
-document_service = DocumentService()
 
 @router.post("/upload")
-async def upload_document(file: UploadFile):
+async def upload_document(
+    file: UploadFile,
+    include_text: bool = False,
+    study_pack: bool = False,
+    document_service: DocumentService = Depends(get_document_service),
+    retrieval_service: RetrievalService = Depends(get_retrieval_service),
+    study_packs: StudyPackService = Depends(get_study_pack_service),
+):
+    """Store the document and return its id; pass include_text=true to also get the extracted text back.
+
+    With study_pack=true the summary and a question bank are precomputed in the background.
+    """
     try:
-        text = await document_service.extract_text(file)
-        return {"text": text, "filename": file.filename}
+        stored, reused = await document_service.ingest(file)
+        index = await retrieval_service.load(stored.document_id)
+        response = {
+            "filename": file.filename,
+            "document_id": stored.document_id,
+            "num_chunks": len(index.chunks),
+            "chars": stored.chars,
+            "reused": reused,
+        }
+        if include_text:
+            response["text"] = await document_service.store.get_text(stored.document_id)
+        if study_pack:
+            response["study_pack"] = (await study_packs.request(stored.document_id)).model_dump()
+        return response
+    except HTTPException:
+        # e.g. the embedding model is rate limited: a 503 the client can retry, not a bad upload
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/upload/stream")
+async def upload_document_stream(
+    file: UploadFile,
+    study_pack: bool = False,
+    document_service: DocumentService = Depends(get_document_service),
+    retrieval_service: RetrievalService = Depends(get_retrieval_service),
+    study_packs: StudyPackService = Depends(get_study_pack_service),
+):
+    """Extract a PDF and stream each page's text using Server-Sent Events as it finishes"""
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Streaming extraction is only available for PDF files.")
+    started = time.perf_counter()
+
+    digest = hashlib.sha256()
+    try:
+        path = await document_service.spool_upload(file, digest)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    content_hash = digest.hexdigest()
+
+    stored = await document_service.store.find_upload(content_hash)
+    if stored:
+        # Same bytes as an earlier upload: nothing to extract
+        os.unlink(path)
+        index = await retrieval_service.load(stored.document_id)
+        if study_pack:
+            await study_packs.request(stored.document_id)
+
+        async def replay_stream():
+            yield f"data: {json.dumps({'type': 'meta', 'filename': file.filename, 'pages': 0, 'reused': True})}\n\n"
+            yield f"data: {json.dumps({'type': 'done', 'document_id': stored.document_id, 'num_chunks': len(index.chunks), 'reused': True})}\n\n"
+
+        return StreamingResponse(replay_stream(), media_type="text/plain", headers={"Cache-Control": "no-cache"})
+
+    try:
+        num_pages = await document_service.count_pdf_pages(path)
+    except ValueError as e:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def generate_stream():
+        try:
+            yield f"data: {json.dumps({'type': 'meta', 'filename': file.filename, 'pages': num_pages})}\n\n"
+
+            pages = [""] * num_pages
+            first = True
+            async for page_number, page_text in document_service.iter_pdf_pages(path, num_pages):
+                if first:
+                    metrics.STREAM_FIRST_CHUNK.observe(time.perf_counter() - started, endpoint="upload")
+                    first = False
+                pages[page_number] = page_text
+                yield f"data: {json.dumps({'type': 'page', 'page': page_number, 'text': page_text})}\n\n"
+
+            # Scanned pages come back through OCR, reported page by page
+            ocr_pages = document_service.image_only_pages(pages) if document_service.ocr else []
+            if ocr_pages:
+                total = min(len(ocr_pages), settings.OCR_MAX_PAGES)
+                yield f"data: {json.dumps({'type': 'ocr', 'pages': total})}\n\n"
+                done = 0
+                async for page_number, page_text in document_service.iter_ocr_pages(path, ocr_pages):
+                    done += 1
+                    pages[page_number] = document_service.merge_ocr_text(pages[page_number], page_text)
+                    yield f"data: {json.dumps({'type': 'page', 'page': page_number, 'text': pages[page_number], 'ocr': True, 'ocr_done': done, 'ocr_total': total})}\n\n"
+
+            text = "\n".join(pages)
+            if not text.strip():
+                raise ValueError("No text content extracted from PDF. The file might be scanned images or corrupted.")
+            await document_service.store.save(text, file.filename, content_hash)
+            index = await retrieval_service.index_document(text)
+            if study_pack:
+                await study_packs.request(index.document_id)
+            yield f"data: {json.dumps({'type': 'done', 'document_id': index.document_id, 'num_chunks': len(index.chunks), 'reused': False})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            os.unlink(path)
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
 @router.post("/summarize")
-async def summarize_text(request: SummarizeRequest):
+async def summarize_text(
+    request: SummarizeRequest,
+    document_service: DocumentService = Depends(get_document_service),
+    document_store: DocumentStore = Depends(get_document_store),
+    study_packs: StudyPackService = Depends(get_study_pack_service),
+):
     try:
-        summary = await document_service.generate_summary(request.text)
+        if request.document_id and not request.fresh:
+            # Precomputed when the document was uploaded as a study pack
+            summary = await study_packs.summary(request.document_id)
+            if summary:
+                return summary
+        text = await document_store.resolve(request.text, request.document_id)
+        summary = await document_service.generate_summary(text, request.fresh)
         return summary
+    except HTTPException:
+        raise
     except ValueError as e:
         # Handle known validation errors with 400 status code
         raise HTTPException(status_code=400, detail=str(e))
@@ -29,3 +164,9 @@ async def summarize_text(request: SummarizeRequest):
             detail="An unexpected error occurred while generating the summary. Please try again later."
         )
 
+@router.get("/{document_id}/study-pack", response_model=StudyPackStatus)
+async def get_study_pack(document_id: str, study_packs: StudyPackService = Depends(get_study_pack_service)):
+    status = await study_packs.status(document_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="No study pack for this document")
+    return status
@@ -0,0 +1,75 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+from models.job import JobSubmitted, JobStatus, JobResult
+from models.quiz import QuizRequest
+from models.document import SummarizeRequest
+from services.job_service import JobService, FINISHED, SUCCEEDED
+from dependencies import get_job_service
+from config import settings
+
+router = APIRouter()
+
+async def _submit(job_service: JobService, kind: str, payload: dict) -> JobSubmitted:
+    job_id, deduplicated = await job_service.submit(kind, payload)
+    status = await job_service.get(job_id)
+    return JobSubmitted(job_id=job_id, status=status.status, deduplicated=deduplicated)
+
+@router.post("/quiz", status_code=202, response_model=JobSubmitted)
+async def submit_quiz_job(request: QuizRequest, job_service: JobService = Depends(get_job_service)):
+    if not request.text and not request.document_id:
+        raise HTTPException(status_code=400, detail="No text provided for quiz generation")
+    return await _submit(job_service, "quiz", request.model_dump())
+
+@router.post("/summary", status_code=202, response_model=JobSubmitted)
+async def submit_summary_job(request: SummarizeRequest, job_service: JobService = Depends(get_job_service)):
+    if not request.text and not request.document_id:
+        raise HTTPException(status_code=400, detail="No text provided for summarization")
+    return await _submit(job_service, "summary", request.model_dump())
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, job_service: JobService = Depends(get_job_service)):
+    status = await job_service.get(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@router.get("/{job_id}/result", response_model=JobResult)
+async def get_job_result(job_id: str, job_service: JobService = Depends(get_job_service)):
+    status = await job_service.get(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status.status not in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is still {status.status}")
+    if status.status != SUCCEEDED:
+        raise HTTPException(status_code=422, detail=status.error or "Job failed")
+    return JobResult(id=job_id, status=status.status, result=await job_service.get_result(job_id))
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, job_service: JobService = Depends(get_job_service)):
+    """Stream job progress using Server-Sent Events until the job finishes"""
+    if not await job_service.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def generate_stream():
+        while True:
+            changed = job_service.watch(job_id)
+            status = await job_service.get(job_id)
+            yield f"data: {json.dumps({'type': 'status', **status.model_dump()})}\n\n"
+            if status.status in FINISHED:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=settings.JOB_EVENT_HEARTBEAT)
+            except asyncio.TimeoutError:
+                pass
+        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
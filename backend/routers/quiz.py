@@ -1,25 +1,40 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 import json
-from models.quiz import QuizRequest, Quiz
+import time
+from models.quiz import QuizRequest, Quiz, BatchAnswerRequest
 from services.quiz_service import QuizService
+from services.document_store import DocumentStore
+from services.study_pack import StudyPackService
+from dependencies import get_quiz_service, get_document_store, get_study_pack_service
+from services import metrics
 
 router = APIRouter()
-quiz_service = QuizService()
 
 @router.post("/generate")
-async def generate_quiz(request: QuizRequest):
-    if not request.text:
+async def generate_quiz(
+    request: QuizRequest,
+    quiz_service: QuizService = Depends(get_quiz_service),
+    document_store: DocumentStore = Depends(get_document_store),
+    study_packs: StudyPackService = Depends(get_study_pack_service),
+):
+    if not request.text and not request.document_id:
         raise HTTPException(status_code=400, detail="No text provided for quiz generation")
     
     try:
-        quiz = await quiz_service.generate_quiz(request.text, request.num_questions)
+        if request.document_id and not request.fresh:
+            # Drawn from the study pack's question bank, without repeating earlier quizzes
+            quiz = await study_packs.take_quiz(request.document_id, request.num_questions)
+            if quiz:
+                return quiz
+        text = await document_store.resolve(request.text, request.document_id)
+        quiz = await quiz_service.generate_quiz(text, request.num_questions, request.fresh)
         return quiz
+    except HTTPException:
+        raise
     except ValueError as e:
         # Handle validation errors
         raise HTTPException(status_code=400, detail=str(e))
-    except json.JSONDecodeError as e:
-        # Handle JSON parsing errors
-        raise HTTPException(status_code=500, detail="Failed to generate quiz: Invalid response format")
     except Exception as e:
         # Log unexpected errors
         print(f"Error generating quiz: {str(e)}")
@@ -28,10 +43,74 @@ async def generate_quiz(request: QuizRequest):
             detail="An unexpected error occurred while generating the quiz. Please try again."
         )
 
+@router.post("/generate/stream")
+async def generate_quiz_stream(
+    request: QuizRequest,
+    quiz_service: QuizService = Depends(get_quiz_service),
+    document_store: DocumentStore = Depends(get_document_store),
+    study_packs: StudyPackService = Depends(get_study_pack_service),
+):
+    """Stream each quiz question using Server-Sent Events as soon as it is generated"""
+    if not request.text and not request.document_id:
+        raise HTTPException(status_code=400, detail="No text provided for quiz generation")
+    started = time.perf_counter()
+    banked = None
+    try:
+        if request.document_id and not request.fresh:
+            banked = await study_packs.take_quiz(request.document_id, request.num_questions)
+        text = None if banked else await document_store.resolve(request.text, request.document_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def replay_bank():
+        for question in banked.questions:
+            yield "question", question
+        yield "quiz", banked
+
+    async def generate_stream():
+        stream = replay_bank() if banked else quiz_service.stream_quiz(text, request.num_questions, request.fresh)
+        first = True
+        try:
+            async for event, payload in stream:
+                if first:
+                    metrics.STREAM_FIRST_CHUNK.observe(time.perf_counter() - started, endpoint="quiz")
+                    first = False
+                if event == "question":
+                    yield f"data: {json.dumps({'type': 'question', 'question': payload.model_dump()})}\n\n"
+                else:
+                    yield f"data: {json.dumps({'type': 'done', 'quiz_id': payload.id, 'num_questions': len(payload.questions)})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(
+        generate_stream(),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
 @router.post("/check-answer")
-async def check_answer(quiz_id: str, question_id: str, answer: int):
+async def check_answer(
+    quiz_id: str, question_id: str, answer: int, quiz_service: QuizService = Depends(get_quiz_service)
+):
     try:
         result = await quiz_service.check_answer(quiz_id, question_id, answer)
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/check-answers")
+async def check_answers(request: BatchAnswerRequest, quiz_service: QuizService = Depends(get_quiz_service)):
+    """Grade every answer of a submission in one round-trip"""
+    try:
+        return await quiz_service.check_answers(request.quiz_id, request.answers)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
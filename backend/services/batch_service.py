@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import os
+from typing import AsyncGenerator, Awaitable, Callable, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, UploadFile
+from config import settings
+from services.document_service import DocumentService
+from services.document_store import DocumentStore
+from services.quiz_service import QuizService
+from services.retrieval_service import RetrievalService
+from services.scheduling import Priority
+
+ItemJob = Callable[[], Awaitable[dict]]
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    if isinstance(error, ValueError):
+        return str(error)
+    print(f"Unexpected error in batch item: {error}")
+    return "An unexpected error occurred while processing this document."
+
+
+class SpooledUpload:
+    """An upload copied to disk while the request is open, with its hash or the reason it was rejected"""
+
+    def __init__(self, filename: str, path: Optional[str] = None, content_hash: str = "", error: str = ""):
+        self.filename = filename
+        self.path = path
+        self.content_hash = content_hash
+        self.error = error
+
+
+class BatchService:
+    """Summaries, quizzes and uploads for many documents in one request.
+
+    Each batch runs at most BATCH_CONCURRENCY items at once, and every batch
+    draws from one shared pool of BATCH_MAX_ITEMS item slots handed out in
+    arrival order. A 30-chapter batch therefore takes turns with other
+    batches instead of queueing all of its model calls ahead of them, and its
+    calls run at bulk priority so chat stays responsive.
+    """
+
+    def __init__(
+        self,
+        document_service: DocumentService,
+        quiz_service: QuizService,
+        retrieval: RetrievalService,
+        store: DocumentStore,
+        max_items: int = None,
+    ):
+        self.document_service = document_service
+        self.quiz_service = quiz_service
+        self.retrieval = retrieval
+        self.store = store
+        self._slots = asyncio.Semaphore(max_items or settings.BATCH_MAX_ITEMS)
+
+    @staticmethod
+    def check_size(count: int) -> None:
+        if count == 0:
+            raise ValueError("No documents provided")
+        if count > settings.BATCH_MAX_DOCUMENTS:
+            raise ValueError(f"At most {settings.BATCH_MAX_DOCUMENTS} documents can be processed in one batch")
+
+    async def run(self, jobs: Sequence[ItemJob]) -> AsyncGenerator[Tuple[int, Optional[dict], Optional[str]], None]:
+        """Yield (index, result, error) for each job as it finishes"""
+        results: asyncio.Queue = asyncio.Queue()
+        pending = iter(range(len(jobs)))
+
+        async def worker():
+            for index in pending:
+                async with self._slots:
+                    try:
+                        results.put_nowait((index, await jobs[index](), None))
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        results.put_nowait((index, None, _error_message(e)))
+
+        workers = [
+            asyncio.create_task(worker()) for _ in range(min(settings.BATCH_CONCURRENCY, len(jobs)))
+        ]
+        try:
+            for _ in range(len(jobs)):
+                yield await results.get()
+        finally:
+            # The client went away or the caller stopped early
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def spool_uploads(self, files: List[UploadFile]) -> List[SpooledUpload]:
+        """Copy every upload to disk and hash it; the request's files are closed once the response starts"""
+        self.check_size(len(files))
+
+        spooled: List[str] = []
+
+        async def spool(file: UploadFile) -> SpooledUpload:
+            try:
+                DocumentService._check_file_type(file.filename)
+                digest = hashlib.sha256()
+                path = await self.document_service.spool_upload(file, digest)
+                spooled.append(path)
+                return SpooledUpload(file.filename, path, digest.hexdigest())
+            except ValueError as e:
+                return SpooledUpload(file.filename, error=str(e))
+
+        try:
+            # Let every copy finish before raising, so no temp file is written after the cleanup below
+            results = await asyncio.gather(*(spool(file) for file in files), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return list(results)
+        except BaseException:
+            for path in spooled:
+                os.unlink(path)
+            raise
+
+    async def stream_uploads(self, uploads: List[SpooledUpload]) -> AsyncGenerator[dict, None]:
+        """Extract, store and index spooled uploads in parallel, one event per file"""
+
+        def job(upload: SpooledUpload) -> ItemJob:
+            async def ingest() -> dict:
+                if upload.error:
+                    raise ValueError(upload.error)
+                try:
+                    stored, reused = await self.document_service.ingest_path(
+                        upload.path, upload.filename, upload.content_hash
+                    )
+                finally:
+                    os.unlink(upload.path)
+                    upload.path = None
+                index = await self.retrieval.load(stored.document_id)
+                return {
+                    "document_id": stored.document_id,
+                    "num_chunks": len(index.chunks),
+                    "chars": stored.chars,
+                    "reused": reused,
+                }
+            return ingest
+
+        try:
+            yield {"type": "meta", "items": len(uploads)}
+            failed = 0
+            async for index, result, error in self.run([job(upload) for upload in uploads]):
+                event = {"type": "item", "index": index, "filename": uploads[index].filename}
+                if error:
+                    failed += 1
+                    event["error"] = error
+                else:
+                    event.update(result)
+                yield event
+            yield {"type": "done", "succeeded": len(uploads) - failed, "failed": failed}
+        finally:
+            # Files never reached because the client disconnected
+            for upload in uploads:
+                if upload.path:
+                    os.unlink(upload.path)
+
+    async def stream_summaries(
+        self, document_ids: List[str], fresh: bool = False, course_summary: bool = False
+    ) -> AsyncGenerator[dict, None]:
+        """Summarize each document, then optionally the whole batch from the per-document summaries"""
+        self.check_size(len(document_ids))
+
+        def job(document_id: str) -> ItemJob:
+            async def summarize() -> dict:
+                text = await self.store.resolve(None, document_id)
+                summary = await self.document_service.generate_summary(text, fresh, priority=Priority.BULK)
+                return {"summary": summary.model_dump()}
+            return summarize
+
+        yield {"type": "meta", "items": len(document_ids)}
+        summaries = {}
+        async for index, result, error in self.run([job(document_id) for document_id in document_ids]):
+            event = {"type": "item", "index": index, "document_id": document_ids[index]}
+            if error:
+                event["error"] = error
+            else:
+                summaries[index] = result["summary"]
+                event.update(result)
+            yield event
+
+        if course_summary and summaries:
+            try:
+                summary = await self.summarize_course([summaries[i] for i in sorted(summaries)], fresh)
+                yield {"type": "course_summary", "summary": summary}
+            except Exception as e:
+                yield {"type": "course_summary", "error": _error_message(e)}
+        yield {"type": "done", "succeeded": len(summaries), "failed": len(document_ids) - len(summaries)}
+
+    async def summarize_course(self, summaries: List[dict], fresh: bool = False) -> dict:
+        """Reduce step over chapter summaries, in the order the documents were given"""
+        notes = "\n\n".join(
+            f"Chapter {i + 1}:\n"
+            + "\n".join(f"- {note}" for note in summary["quick_notes"])
+            + "\nKey takeaways:\n"
+            + "\n".join(f"- {takeaway}" for takeaway in summary["key_takeaways"])
+            for i, summary in enumerate(summaries)
+        )
+        summary = await self.document_service.generate_summary(notes, fresh, priority=Priority.BULK)
+        return summary.model_dump()
+
+    async def stream_quizzes(
+        self, document_ids: List[str], num_questions: int, fresh: bool = False
+    ) -> AsyncGenerator[dict, None]:
+        """Generate and store one quiz per document"""
+        self.check_size(len(document_ids))
+
+        def job(document_id: str) -> ItemJob:
+            async def generate() -> dict:
+                text = await self.store.resolve(None, document_id)
+                quiz = await self.quiz_service.generate_quiz(text, num_questions, fresh)
+                return {"quiz": quiz.model_dump()}
+            return generate
+
+        yield {"type": "meta", "items": len(document_ids)}
+        failed = 0
+        async for index, result, error in self.run([job(document_id) for document_id in document_ids]):
+            event = {"type": "item", "index": index, "document_id": document_ids[index]}
+            if error:
+                failed += 1
+                event["error"] = error
+            else:
+                event.update(result)
+            yield event
+        yield {"type": "done", "succeeded": len(document_ids) - failed, "failed": failed}
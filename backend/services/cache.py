@@ -0,0 +1,147 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from config import settings
+from services.storage import SQLitePool
+from services import metrics
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-extracted copies of the same document share a key"""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """Content-addressed cache for LLM results.
+
+    Values are JSON-serializable objects. A bounded in-memory LRU tier (entry
+    count, total bytes and TTL) sits in front of an optional SQLite tier that
+    survives restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_bytes: int = None,
+        ttl_seconds: float = None,
+        db_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries or settings.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.CACHE_MAX_BYTES
+        self.ttl_seconds = ttl_seconds or settings.CACHE_TTL_SECONDS
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, payload)
+        self._memory_bytes = 0
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        db_path = db_path if db_path is not None else settings.CACHE_DB_PATH
+        self._db = SQLitePool(db_path, size=2) if db_path else None
+        if self._db:
+            self._db.execute(lambda conn: conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)"
+            ))
+
+    @staticmethod
+    def make_key(kind: str, text: str, template_version: str, **params: Any) -> str:
+        """Hash of the normalized text, prompt template version, model and parameters"""
+        digest = hashlib.sha256()
+        model = settings.MODEL_NAME
+        if settings.LLM_BACKEND != "gemini":
+            # Keep stub answers out of a cache that real responses share
+            model = f"{settings.LLM_BACKEND}:{model}"
+        header = json.dumps(
+            {"kind": kind, "template": template_version, "model": model, "params": params},
+            sort_keys=True,
+        )
+        digest.update(header.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return f"{kind}:{digest.hexdigest()}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry:
+            expires_at, payload = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                metrics.CACHE_REQUESTS.inc(kind=key.split(":", 1)[0], result="memory_hit")
+                return json.loads(payload)
+            self._evict(key)
+
+        if self._db:
+            row = await self._db.run(lambda conn: conn.execute(
+                "SELECT payload, expires_at FROM response_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone())
+            if row:
+                self._remember(key, row[0], row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                metrics.CACHE_REQUESTS.inc(kind=key.split(":", 1)[0], result="disk_hit")
+                return json.loads(row[0])
+
+        self.misses += 1
+        metrics.CACHE_REQUESTS.inc(kind=key.split(":", 1)[0], result="miss")
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        payload = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, payload, expires_at)
+        if self._db:
+            await self._db.run(lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at),
+            ))
+
+    def _remember(self, key: str, payload: str, expires_at: float) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        self._evict(key)
+        self._memory[key] = (expires_at, payload)
+        self._memory_bytes += len(payload)
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._evict(oldest)
+
+    def _evict(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry:
+            self._memory_bytes -= len(entry[1])
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._memory.items() if expires_at <= now]:
+            self._evict(key)
+        if self._db:
+            self._db.execute(lambda conn: conn.execute(
+                "DELETE FROM response_cache WHERE expires_at <= ?", (now,)
+            ))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._memory),
+            "bytes": self._memory_bytes,
+            "disk_enabled": self._db is not None,
+        }
+
+    def close(self) -> None:
+        if self._db:
+            self._db.close()
@@ -1,11 +1,42 @@
 from services.gemini_service import GeminiService
-from typing import AsyncGenerator
+from services.retrieval_service import RetrievalService
+from services.session_service import SessionService
+from services.scheduling import Priority
+from services.prompt_budget import PromptPart, fit_parts
+from services import metrics
+from typing import AsyncGenerator, Optional
 
 class ChatService:
-    def __init__(self):
-        self.gemini = GeminiService()
+    def __init__(self, gemini: GeminiService, retrieval: RetrievalService, sessions: SessionService):
+        self.gemini = gemini
+        self.retrieval = retrieval
+        self.sessions = sessions
 
-    async def generate_response(self, message: str, context: str) -> str:
+    async def resolve_context(
+        self, message: str, context: Optional[str], document_id: Optional[str], top_k: Optional[int] = None
+    ) -> str:
+        """Use the most relevant chunks of an indexed document, falling back to raw context"""
+        if document_id:
+            with metrics.stage("retrieval"):
+                chunks = await self.retrieval.retrieve(document_id, message, top_k)
+            return "\n\n---\n\n".join(chunks)
+        if context:
+            return context
+        raise ValueError("Either document_id or context must be provided")
+
+    @classmethod
+    def fit_prompt(cls, message: str, context: str, history: str = "") -> str:
+        """Build the prompt within the token budget, dropping older history before retrieved context"""
+        with metrics.stage("prompt_build"):
+            fitted = fit_parts([
+                PromptPart("instructions", cls.build_prompt(message, "", ""), required=True),
+                PromptPart("context", context, priority=0, keep="head"),
+                PromptPart("history", history, priority=1, keep="tail"),
+            ])
+            return cls.build_prompt(message, fitted["context"], fitted["history"])
+
+    @staticmethod
+    def build_prompt(message: str, context: str, history: str = "") -> str:
         prompt = (
             "You are a helpful study assistant. Your role is to help students understand "
             "the content they are studying. Format your responses using Markdown for better readability.\n\n"
@@ -17,30 +48,69 @@ class ChatService:
             "- Keep paragraphs short and well-organized\n\n"
             "Answer the question thoroughly and clearly using the provided context. "
             "If you cannot answer based on the context, say so.\n\n"
+        )
+        if history:
+            prompt += f"Conversation so far:\n{history}\n"
+        return prompt + (
             f"Context: {context}\n\n"
             f"Question: {message}"
         )
-        
-        response = await self.gemini.analyze_with_context(message, context)
-        return response
 
-    async def generate_response_stream(self, message: str, context: str) -> AsyncGenerator[str, None]:
+    async def create_session(self, document_id: Optional[str] = None, context: Optional[str] = None) -> str:
+        """Start a conversation tied to an indexed document (raw context is indexed first)"""
+        if document_id:
+            if not await self.retrieval.load(document_id):
+                raise ValueError("Document not found. Please upload it again.")
+        elif context:
+            document_id = (await self.retrieval.index_document(context)).document_id
+        else:
+            raise ValueError("Either document_id or context must be provided")
+        return self.sessions.create(document_id).id
+
+    async def generate_response(
+        self,
+        message: str,
+        context: Optional[str] = None,
+        document_id: Optional[str] = None,
+        top_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> str:
+        if session_id:
+            session = self.sessions.get(session_id)
+            async with session.lock:
+                context = await self.resolve_context(message, None, session.document_id, top_k)
+                prompt = self.fit_prompt(message, context, session.history_text())
+                response = await self.gemini.generate_text(prompt, priority=Priority.INTERACTIVE)
+                session.add_turn(message, response)
+            self.sessions.schedule_compaction(session)
+            return response
+
+        context = await self.resolve_context(message, context, document_id, top_k)
+        return await self.gemini.generate_text(self.fit_prompt(message, context), priority=Priority.INTERACTIVE)
+
+    async def generate_response_stream(
+        self,
+        message: str,
+        context: Optional[str] = None,
+        document_id: Optional[str] = None,
+        top_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
         """Generate streaming response for chat"""
-        prompt = (
-            "You are a helpful study assistant. Your role is to help students understand "
-            "the content they are studying. Format your responses using Markdown for better readability.\n\n"
-            "FORMATTING GUIDELINES:\n"
-            "- Use **bold** for important terms and concepts\n"
-            "- Use bullet points or numbered lists for multiple items\n"
-            "- Use headers (## or ###) to organize sections if needed\n"
-            "- Use code blocks for technical content or examples\n"
-            "- Keep paragraphs short and well-organized\n\n"
-            "Answer the question thoroughly and clearly using the provided context. "
-            "If you cannot answer based on the context, say so.\n\n"
-            f"Context: {context}\n\n"
-            f"Question: {message}"
-        )
-        
-        async for chunk in self.gemini.analyze_with_context_stream(message, context):
-            yield chunk
+        if not session_id:
+            context = await self.resolve_context(message, context, document_id, top_k)
+            async for chunk in self.gemini.generate_text_stream(self.fit_prompt(message, context)):
+                yield chunk
+            return
 
+        session = self.sessions.get(session_id)
+        async with session.lock:
+            context = await self.resolve_context(message, None, session.document_id, top_k)
+            prompt = self.fit_prompt(message, context, session.history_text())
+            chunks = []
+            async for chunk in self.gemini.generate_text_stream(prompt):
+                chunks.append(chunk)
+                yield chunk
+            # Only completed answers become part of the history
+            session.add_turn(message, "".join(chunks))
+        self.sessions.schedule_compaction(session)
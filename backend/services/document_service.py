@@ -1,50 +1,305 @@
-import PyPDF2
-from io import BytesIO
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import time
+import zlib
+from concurrent.futures import Executor
 from fastapi import UploadFile, HTTPException
 from models.document import DocumentSummary
+from typing import AsyncGenerator, List, Optional, Tuple
+from config import settings
 from services.gemini_service import GeminiService
+from services.scheduling import Priority
+from services.cache import ResponseCache
+from services.document_store import DocumentStore, StoredDocument
+from services.ocr import OCRService
+from services.retrieval_service import chunk_text
+from services import pdf_extraction
+from services.prompt_budget import estimate_tokens, prompt_budget
+from services import metrics
 
-class DocumentService:
-    def __init__(self):
-        self.gemini = GeminiService()
+# Bump when the summary prompt or parsing changes so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = "2"
+SECTION_PROMPT_VERSION = "1"
 
-    async def extract_text(self, file: UploadFile) -> str:
-        content = await file.read()
-        
-        if not content:
-            raise ValueError("Empty file uploaded")
-            
-        if file.filename.endswith('.pdf'):
-            try:
-                pdf_reader = PyPDF2.PdfReader(BytesIO(content))
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                
-                if not text.strip():
-                    raise ValueError("No text content extracted from PDF. The file might be scanned images or corrupted.")
-                    
-                return text
-            except Exception as e:
-                raise ValueError(f"Failed to read PDF file: {str(e)}")
-        elif file.filename.endswith('.txt'):
-            try:
-                text = content.decode('utf-8')
-                if not text.strip():
-                    raise ValueError("Empty text file uploaded")
-                return text
-            except UnicodeDecodeError:
-                raise ValueError("Invalid text file encoding. Please ensure the file is UTF-8 encoded.")
+# Tokens held back for the summary instructions wrapped around the text
+SUMMARY_PROMPT_OVERHEAD = 512
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def split_sections(text: str, max_chars: int) -> List[str]:
+    """Split text into sections of at most max_chars on paragraph boundaries.
+
+    Cut points are content-defined: once a section is at least half full, a
+    paragraph whose checksum falls in a fixed bucket ends it. An edit therefore
+    only changes the sections around it, and the cached summaries of the other
+    sections stay valid.
+    """
+    paragraphs = [p.strip() for p in _PARAGRAPH_RE.split(text) if p.strip()]
+    if len(paragraphs) <= 1:
+        paragraphs = [p.strip() for p in text.splitlines() if p.strip()]
+
+    sections = []
+    current: List[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        if len(paragraph) > max_chars:
+            pieces = chunk_text(paragraph, max_chars, 0)
         else:
+            pieces = [paragraph]
+        for piece in pieces:
+            if current and size + len(piece) > max_chars:
+                sections.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+            if size >= max_chars // 2 and zlib.crc32(piece.encode("utf-8")) % 4 == 0:
+                sections.append("\n\n".join(current))
+                current, size = [], 0
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+class DocumentService:
+    def __init__(
+        self,
+        gemini: GeminiService,
+        cache: Optional[ResponseCache] = None,
+        pdf_pool: Optional[Executor] = None,
+        store: Optional[DocumentStore] = None,
+        ocr: Optional[OCRService] = None,
+    ):
+        self.gemini = gemini
+        self.cache = cache
+        self.store = store
+        # Fallback for scanned pages; None when no OCR engine is installed
+        self.ocr = ocr
+        # PDF parsing is CPU-bound; a process pool keeps it off the event loop and the GIL
+        self.pdf_pool = pdf_pool
+        if pdf_pool is not None and hasattr(pdf_pool, "_pending_work_items"):
+            # Submitted batches beyond the ones the workers are running
+            metrics.EXECUTOR_QUEUE.set_function(
+                lambda: max(0, len(pdf_pool._pending_work_items) - pdf_pool._max_workers), pool="pdf"
+            )
+
+    async def warm_up(self) -> None:
+        """Start an extraction worker so the first upload does not wait for one"""
+        if self.pdf_pool is not None:
+            await asyncio.get_running_loop().run_in_executor(self.pdf_pool, pdf_extraction.warm_up)
+
+    async def spool_upload(self, file: UploadFile, digest=None) -> str:
+        """Copy the upload to a temp file in fixed-size chunks, enforcing MAX_UPLOAD_BYTES.
+
+        When a hashlib digest is given it is fed every chunk, hashing the upload on the way through.
+        """
+        if file.size is not None and file.size > settings.MAX_UPLOAD_BYTES:
+            raise ValueError(self._too_large_message())
+
+        suffix = os.path.splitext(file.filename or "")[1]
+        loop = asyncio.get_running_loop()
+        spool = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        total = 0
+        try:
+            while True:
+                chunk = await file.read(settings.UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > settings.MAX_UPLOAD_BYTES:
+                    raise ValueError(self._too_large_message())
+                await loop.run_in_executor(None, self._write_chunk, spool, chunk, digest)
+            spool.close()
+            if total == 0:
+                raise ValueError("Empty file uploaded")
+            return spool.name
+        except BaseException:
+            spool.close()
+            os.unlink(spool.name)
+            raise
+
+    @staticmethod
+    def _write_chunk(spool, chunk: bytes, digest) -> None:
+        spool.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+
+    @staticmethod
+    def _too_large_message() -> str:
+        return f"File too large. Maximum upload size is {settings.MAX_UPLOAD_BYTES / (1024 * 1024):g} MB."
+
+    async def count_pdf_pages(self, path: str) -> int:
+        loop = asyncio.get_running_loop()
+        try:
+            num_pages = await loop.run_in_executor(self.pdf_pool, pdf_extraction.count_pages, path)
+        except Exception as e:
+            raise ValueError(f"Failed to read PDF file: {str(e)}")
+        if num_pages > settings.MAX_PDF_PAGES:
+            raise ValueError(f"PDF has {num_pages} pages. Maximum supported is {settings.MAX_PDF_PAGES}.")
+        return num_pages
+
+    async def iter_pdf_pages(self, path: str, num_pages: int) -> AsyncGenerator[Tuple[int, str], None]:
+        """Yield (page_number, text) as page batches finish in the extraction pool"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        batch = settings.PDF_PAGE_BATCH
+        pending = [
+            loop.run_in_executor(
+                self.pdf_pool, pdf_extraction.extract_page_range, path, start, min(start + batch, num_pages)
+            )
+            for start in range(0, num_pages, batch)
+        ]
+        try:
+            for next_batch in asyncio.as_completed(pending):
+                try:
+                    pages = await next_batch
+                except Exception as e:
+                    raise ValueError(f"Failed to read PDF file: {str(e)}")
+                for page_number, text in pages:
+                    yield page_number, text
+        finally:
+            for future in pending:
+                future.cancel()
+            metrics.record_stage("pdf_parse", time.perf_counter() - started)
+
+    @staticmethod
+    def image_only_pages(pages: List[str]) -> List[int]:
+        """Pages whose text layer is empty or too thin to be real content, i.e. likely scans"""
+        return [i for i, text in enumerate(pages) if len(text.strip()) < settings.OCR_MIN_PAGE_CHARS]
+
+    @staticmethod
+    def merge_ocr_text(original: str, ocr_text: str) -> str:
+        """The OCR text for a page, unless it found no more than the text layer already had"""
+        return ocr_text if len(ocr_text.strip()) > len(original.strip()) else original
+
+    async def iter_ocr_pages(self, path: str, page_numbers: List[int]) -> AsyncGenerator[Tuple[int, str], None]:
+        """Yield (page_number, text) as the OCR pool recognizes each image-only page"""
+        if self.ocr is None or not page_numbers:
+            return
+        with metrics.stage("ocr"):
+            async for page_number, text in self.ocr.recognize_pages(path, page_numbers):
+                yield page_number, text
+
+    async def ingest(self, file: UploadFile) -> Tuple[StoredDocument, bool]:
+        """Extract and store an upload, or return the stored document if these exact bytes were seen before"""
+        self._check_file_type(file.filename)
+        digest = hashlib.sha256()
+        path = await self.spool_upload(file, digest)
+        try:
+            return await self.ingest_path(path, file.filename, digest.hexdigest())
+        finally:
+            os.unlink(path)
+
+    async def ingest_path(self, path: str, filename: str, content_hash: str) -> Tuple[StoredDocument, bool]:
+        """Same as ingest, for an upload already spooled to path; the caller removes the file"""
+        stored = await self.store.find_upload(content_hash)
+        if stored:
+            return stored, True
+        text = await self._extract_path(path, filename)
+        return await self.store.save(text, filename, content_hash), False
+
+    @staticmethod
+    def _check_file_type(filename: str) -> None:
+        if not filename.endswith(('.pdf', '.txt')):
             raise ValueError("Unsupported file type. Only PDF and TXT files are supported.")
 
-    async def generate_summary(self, text: str) -> DocumentSummary:
+    async def _extract_path(self, path: str, filename: str) -> str:
+        if filename.endswith('.pdf'):
+            num_pages = await self.count_pdf_pages(path)
+            pages = [""] * num_pages
+            async for page_number, page_text in self.iter_pdf_pages(path, num_pages):
+                pages[page_number] = page_text
+            async for page_number, page_text in self.iter_ocr_pages(path, self.image_only_pages(pages)):
+                pages[page_number] = self.merge_ocr_text(pages[page_number], page_text)
+            # Join once at the end instead of growing a string page by page
+            text = "\n".join(pages)
+
+            if not text.strip():
+                raise ValueError("No text content extracted from PDF. The file might be scanned images or corrupted.")
+            return text
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_text_file, path)
+
+    @staticmethod
+    def _read_text_file(path: str) -> str:
+        try:
+            with open(path, "rb") as f:
+                text = f.read().decode('utf-8')
+        except UnicodeDecodeError:
+            raise ValueError("Invalid text file encoding. Please ensure the file is UTF-8 encoded.")
+        if not text.strip():
+            raise ValueError("Empty text file uploaded")
+        return text
+
+    async def _summarize_section(self, section: str, slots: asyncio.Semaphore, fresh: bool, priority: int) -> str:
+        cache_key = None
+        if self.cache:
+            cache_key = ResponseCache.make_key("summary_section", section, SECTION_PROMPT_VERSION)
+            if not fresh:
+                cached = await self.cache.get(cache_key)
+                if cached:
+                    return cached
+
+        format_instructions = (
+            "This text is one section of a longer document. Summarize it as concise bullet points "
+            "covering every main concept, definition, fact and argument it contains. "
+            "Respond with bullet points only, one per line, each starting with \"- \"."
+        )
+        async with slots:
+            notes = await self.gemini.generate_structured_text(
+                f"Section text:\n{section}", format_instructions, priority=priority
+            )
+        notes = notes.strip()
+        if cache_key and notes:
+            await self.cache.set(cache_key, notes)
+        return notes
+
+    async def _reduce_to_notes(self, text: str, fresh: bool, priority: int = Priority.DEFAULT) -> str:
+        """Map step: summarize sections concurrently until the notes fit one prompt"""
+        limit = self.single_pass_tokens()
+        section_tokens = min(settings.SUMMARY_SECTION_TOKENS, limit)
+        slots = asyncio.Semaphore(settings.SUMMARY_FANOUT)
+        while True:
+            tokens = estimate_tokens(text)
+            if tokens <= limit:
+                return text
+            # Size sections in characters using this text's own chars-per-token ratio
+            section_chars = max(1, len(text) * section_tokens // tokens)
+            sections = split_sections(text, section_chars)
+            partials = await asyncio.gather(
+                *(self._summarize_section(section, slots, fresh, priority) for section in sections)
+            )
+            notes = "\n\n".join(
+                f"Section {i + 1}:\n{partial}" for i, partial in enumerate(partials) if partial
+            )
+            if not notes or len(notes) >= len(text):
+                raise ValueError("Section summaries did not shrink the document")
+            text = notes
+
+    @staticmethod
+    def single_pass_tokens() -> int:
+        """Largest text summarized in one prompt: the configured size, capped by the model budget"""
+        return min(settings.SUMMARY_SINGLE_PASS_TOKENS, prompt_budget() - SUMMARY_PROMPT_OVERHEAD)
+
+    async def generate_summary(
+        self, text: str, fresh: bool = False, priority: int = Priority.DEFAULT
+    ) -> DocumentSummary:
+        """Summarize text in one pass, or map-reduce over sections when it is too long for one prompt"""
         if not text or len(text.strip()) < 50:
             raise HTTPException(
                 status_code=400,
                 detail="Text is too short or empty. Please provide more content for summarization."
             )
 
+        cache_key = None
+        if self.cache:
+            cache_key = ResponseCache.make_key("summary", text, SUMMARY_PROMPT_VERSION)
+            if not fresh:
+                cached = await self.cache.get(cache_key)
+                if cached:
+                    return DocumentSummary(**cached)
+
         format_instructions = """
         Analyze the provided text and create a comprehensive summary with two sections:
         1. Quick Notes: Concise bullet points of main concepts and facts
@@ -64,12 +319,29 @@ class DocumentService:
         Note: Each bullet point should be clear and complete. Quick notes should be concise (1-2 lines) while takeaways can be more detailed (2-3 lines).
         """
 
-        prompt = f"Text to analyze:\n{text}"
+        try:
+            if estimate_tokens(text) > self.single_pass_tokens():
+                with metrics.stage("summary_map"):
+                    notes = await self._reduce_to_notes(text, fresh, priority)
+                prompt = f"Section-by-section notes covering a longer document:\n{notes}"
+            else:
+                prompt = f"Text to analyze:\n{text}"
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error summarizing document sections: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to generate summary. Please try again with a different text or contact support."
+            )
         
         try:
-            response = await self.gemini.generate_structured_text(prompt, format_instructions)
+            response = await self.gemini.generate_structured_text(
+                prompt, format_instructions, priority=priority
+            )
             
             # Process the response to extract quick notes and key takeaways
+            parse_started = time.perf_counter()
             parts = response.split("Key Takeaways:")
             if len(parts) != 2:
                 raise ValueError("Invalid response format from AI")
@@ -91,10 +363,13 @@ class DocumentService:
             if not quick_notes or not key_takeaways:
                 raise ValueError("Empty summary sections generated")
                 
-            return DocumentSummary(
+            summary = DocumentSummary(
                 quick_notes=quick_notes,
                 key_takeaways=key_takeaways
             )
+            metrics.record_stage("response_parse", time.perf_counter() - parse_started)
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error generating summary: {e}")
             raise HTTPException(
@@ -102,3 +377,6 @@ class DocumentService:
                 detail="Failed to generate summary. Please try again with a different text or contact support."
             )
 
+        if cache_key:
+            await self.cache.set(cache_key, summary.model_dump())
+        return summary
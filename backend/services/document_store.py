@@ -0,0 +1,169 @@
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import settings
+from services.storage import SQLitePool
+from services.retrieval_service import RetrievalService
+
+DOCUMENT_NOT_FOUND = "Document not found. Please upload it again."
+
+# Memory hits refresh the on-disk access time at most this often
+_TOUCH_INTERVAL = 3600
+
+
+class StoredDocument:
+    def __init__(self, document_id: str, filename: str, chars: int, created_at: float):
+        self.document_id = document_id
+        self.filename = filename
+        self.chars = chars
+        self.created_at = created_at
+
+
+class DocumentStore:
+    """Extracted document text, stored once and referenced by id.
+
+    Text is zlib-compressed in SQLite and only decompressed when a request
+    needs it; recently used texts stay in a size-bounded LRU. Uploads are
+    also keyed by a hash of their raw bytes, so re-uploading the same file
+    skips extraction. Document ids are the retrieval index ids, so chat,
+    summaries and quizzes all refer to a document the same way.
+    """
+
+    def __init__(self, db_path: str = None, memory_chars: int = None, ttl_seconds: float = None):
+        self.memory_chars = memory_chars or settings.DOCUMENT_CACHE_CHARS
+        self.ttl_seconds = ttl_seconds or settings.DOCUMENT_TTL_SECONDS
+        self._db = SQLitePool(db_path or settings.DOCUMENT_DB_PATH)
+        self._db.execute(self._create_schema)
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_size = 0
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.disk_loads = 0
+        self.reused_uploads = 0
+
+    @staticmethod
+    def _create_schema(conn) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, filename TEXT NOT NULL, chars INTEGER NOT NULL, body BLOB NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS documents_accessed_at ON documents (accessed_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_uploads ("
+            "content_hash TEXT PRIMARY KEY, document_id TEXT NOT NULL) WITHOUT ROWID"
+        )
+
+    async def find_upload(self, content_hash: str) -> Optional[StoredDocument]:
+        """The document previously extracted from identical upload bytes, if it is still stored"""
+
+        def _select(conn):
+            return conn.execute(
+                "SELECT d.id, d.filename, d.chars, d.created_at FROM document_uploads u "
+                "JOIN documents d ON d.id = u.document_id WHERE u.content_hash = ?",
+                (content_hash,),
+            ).fetchone()
+
+        row = await self._db.run(_select)
+        if not row:
+            return None
+        self.reused_uploads += 1
+        return StoredDocument(*row)
+
+    async def save(self, text: str, filename: str, content_hash: Optional[str] = None) -> StoredDocument:
+        document_id = RetrievalService.document_id_for(text)
+        now = time.time()
+
+        def _insert(conn):
+            # Compressed on the worker thread, off the event loop
+            conn.execute(
+                "INSERT INTO documents (id, filename, chars, body, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET accessed_at = excluded.accessed_at",
+                (document_id, filename, len(text), zlib.compress(text.encode("utf-8"), 6), now, now),
+            )
+            if content_hash:
+                conn.execute(
+                    "INSERT OR REPLACE INTO document_uploads (content_hash, document_id) VALUES (?, ?)",
+                    (content_hash, document_id),
+                )
+
+        await self._db.run(_insert)
+        self._touched[document_id] = now
+        self._remember(document_id, text)
+        return StoredDocument(document_id, filename, len(text), now)
+
+    async def get_text(self, document_id: str) -> Optional[str]:
+        now = time.time()
+        text = self._memory.get(document_id)
+        if text is not None:
+            self._memory.move_to_end(document_id)
+            self.hits += 1
+            if now - self._touched.get(document_id, 0) > _TOUCH_INTERVAL:
+                self._touched[document_id] = now
+                await self._db.run(lambda conn: conn.execute(
+                    "UPDATE documents SET accessed_at = ? WHERE id = ?", (now, document_id)
+                ))
+            return text
+
+        def _load(conn):
+            row = conn.execute("SELECT body FROM documents WHERE id = ?", (document_id,)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE documents SET accessed_at = ? WHERE id = ?", (now, document_id))
+            return zlib.decompress(row[0]).decode("utf-8")
+
+        text = await self._db.run(_load)
+        if text is not None:
+            self._touched[document_id] = now
+            self.disk_loads += 1
+            self._remember(document_id, text)
+        return text
+
+    async def resolve(self, text: Optional[str], document_id: Optional[str]) -> str:
+        """Text for a request that sent either the text itself or the id of a stored document"""
+        if document_id:
+            stored = await self.get_text(document_id)
+            if stored is None:
+                raise ValueError(DOCUMENT_NOT_FOUND)
+            return stored
+        if text:
+            return text
+        raise ValueError("Either document_id or text must be provided")
+
+    def _remember(self, document_id: str, text: str) -> None:
+        if len(text) > self.memory_chars:
+            return
+        previous = self._memory.pop(document_id, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[document_id] = text
+        self._memory_size += len(text)
+        while self._memory_size > self.memory_chars:
+            evicted_id, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self._touched.pop(evicted_id, None)
+
+    def purge_expired(self) -> None:
+        """Drop documents nobody has used within the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+
+        def _delete(conn):
+            conn.execute("DELETE FROM documents WHERE accessed_at < ?", (cutoff,))
+            conn.execute(
+                "DELETE FROM document_uploads WHERE document_id NOT IN (SELECT id FROM documents)"
+            )
+
+        self._db.execute(_delete)
+
+    def stats(self) -> dict:
+        return {
+            "memory_documents": len(self._memory),
+            "memory_chars": self._memory_size,
+            "memory_hits": self.hits,
+            "disk_loads": self.disk_loads,
+            "reused_uploads": self.reused_uploads,
+        }
+
+    def close(self) -> None:
+        self._db.close()
@@ -1,95 +1,344 @@
-import google.generativeai as genai
 from config import settings
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import AsyncGenerator
+import threading
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import AsyncGenerator, List, Sequence
 import json
+from fastapi import HTTPException
+from services.scheduling import Priority, PriorityLimiter
+from services.singleflight import SingleFlight, StreamFlight, fingerprint
+from services.prompt_budget import check_prompt, estimate_tokens
+from services.llm_backends import ModelBackend, create_backend
+from services import metrics
+from services.resilience import (
+    CircuitBreaker, RateLimiter, UpstreamTimeoutError, UpstreamUnavailableError, backoff_delay, is_transient,
+)
 
 class GeminiService:
-    def __init__(self):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(settings.MODEL_NAME)
-        self._executor = ThreadPoolExecutor()
+    """Application-scoped Gemini client.
 
-    async def generate_text(self, prompt: str) -> str:
-        """Generate text using Gemini API"""
-        try:
-            if not prompt or len(prompt.strip()) == 0:
-                raise ValueError("Empty prompt provided")
+    One instance is created in the FastAPI lifespan and shared by every service,
+    so the whole process has a single sized worker pool and a global,
+    priority-ordered cap on concurrent upstream calls. Calls are paced to the
+    RPM/TPM quota, retried with jittered backoff on transient errors, bounded
+    by a timeout, and shed by a circuit breaker while the upstream is down.
+    The model itself is a pluggable backend (Gemini, or a local stub for
+    development and load tests).
+    """
+
+    def __init__(self, max_workers: int = None, max_concurrency: int = None, backend: ModelBackend = None):
+        self.backend = backend or create_backend()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.LLM_MAX_WORKERS,
+            thread_name_prefix="gemini",
+        )
+        self.limiter = PriorityLimiter(max_concurrency or settings.LLM_MAX_CONCURRENCY)
+        # Streams are admitted by priority too, so bulk quiz fan-out never queues ahead of a chat
+        self._stream_slots = PriorityLimiter(settings.MAX_CONCURRENT_STREAMS)
+        # Identical concurrent prompts (e.g. a class summarizing the same handout) share one call
+        self._flights = SingleFlight()
+        self._stream_flights = StreamFlight()
+        self.rate_limiter = RateLimiter(settings.LLM_RPM, settings.LLM_TPM, settings.LLM_QUEUE_TIMEOUT)
+        self.breaker = CircuitBreaker(settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS)
+        self.retries = 0
+        metrics.LLM_IN_FLIGHT.set_function(lambda: self.limiter.in_flight)
+        metrics.LLM_WAITING.set_function(lambda: self.limiter.waiting, queue="slot")
+        metrics.LLM_WAITING.set_function(lambda: self.rate_limiter.waiting, queue="quota")
+        # Work submitted to the pool that no thread has picked up yet
+        metrics.EXECUTOR_QUEUE.set_function(lambda: self._executor._work_queue.qsize(), pool="llm")
+
+    async def warm_up(self) -> None:
+        """Load the model client on a worker thread ahead of the first request"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.backend.warm_up)
+
+    def shutdown(self) -> None:
+        """Stop accepting work and drop calls that have not started yet"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                self._executor,
-                lambda: self.model.generate_content(prompt)
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "calls": self._flights.executions,
+            "coalesced_calls": self._flights.coalesced,
+            "streams": self._stream_flights.executions,
+            "coalesced_streams": self._stream_flights.coalesced,
+            "retries": self.retries,
+            "quota_waiting": self.rate_limiter.waiting,
+            "quota_throttled": self.rate_limiter.throttled,
+            "quota_rejected": self.rate_limiter.rejected,
+            "circuit_state": self.breaker.state,
+            "circuit_rejected": self.breaker.rejected,
+        }
+
+    @staticmethod
+    def _map_error(error: Exception, action: str) -> Exception:
+        """Translate a failed upstream call into the error the API reports"""
+        if isinstance(error, HTTPException):
+            return error
+        if "API key not available" in str(error):
+            return ValueError("Gemini API key not configured properly")
+        if is_transient(error):
+            return UpstreamUnavailableError(
+                "Gemini API is busy or rate limited. Please try again later",
+                retry_after=settings.LLM_RETRY_MAX_DELAY,
             )
-            
-            if not response:
-                raise ValueError("No response received from Gemini API")
-                
-            if not hasattr(response, 'text'):
-                raise ValueError(f"Unexpected response format: {response}")
-                
-            return response.text
-        except Exception as e:
-            print(f"Error generating text: {str(e)}")
-            if "API key not available" in str(e):
-                raise ValueError("Gemini API key not configured properly")
-            elif "Rate limit exceeded" in str(e):
-                raise ValueError("Gemini API rate limit exceeded. Please try again later")
+        return ValueError(f"Error {action}: {str(error)}")
+
+    async def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """Record the outcome with the breaker and back off before a retry, if one is warranted"""
+        if not is_transient(error):
+            # The upstream answered; the request itself was rejected
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        if attempt >= settings.LLM_MAX_RETRIES or self.breaker.state == CircuitBreaker.OPEN:
+            return False
+        if isinstance(error, UpstreamTimeoutError):
+            # The timed-out call is still running on its thread; another attempt
+            # would only stack a second thread on a hung upstream
+            return False
+        delay = backoff_delay(attempt, settings.LLM_RETRY_BASE_DELAY, settings.LLM_RETRY_MAX_DELAY)
+        print(f"Retrying Gemini call in {delay:.2f}s after transient error: {str(error)}")
+        self.retries += 1
+        metrics.LLM_RETRIES.inc()
+        await asyncio.sleep(delay)
+        return True
+
+    async def generate_text(self, prompt: str, priority: int = Priority.DEFAULT) -> str:
+        """Generate text using Gemini API, coalescing identical in-flight prompts"""
+        if prompt:
+            check_prompt(prompt)
+        if not settings.LLM_COALESCE:
+            return await self._generate_text(prompt, priority)
+        key = fingerprint(settings.MODEL_NAME, prompt)
+        return await self._flights.do(key, lambda: self._generate_text(prompt, priority))
+
+    async def _generate_text(self, prompt: str, priority: int) -> str:
+        if not prompt or len(prompt.strip()) == 0:
+            raise ValueError("Empty prompt provided")
+
+        text = await self._call(
+            self.backend.generate, prompt, estimate_tokens(prompt), priority, "unary", "generating text"
+        )
+        metrics.LLM_TOKENS.inc(estimate_tokens(text), direction="completion")
+        return text
+
+    async def _call(self, fn, payload, tokens: int, priority: int, mode: str, action: str):
+        """Run one blocking backend call under the shared limits: breaker, priority slot, quota, timeout and retries"""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                queued = time.perf_counter()
+                async with self._worker_slot(priority) as workers:
+                    await self.rate_limiter.acquire(tokens)
+                    metrics.record_stage("llm_queue", time.perf_counter() - queued)
+                    metrics.LLM_TOKENS.inc(tokens, direction="prompt")
+                    worker = loop.run_in_executor(self._executor, self._timed(fn), payload)
+                    workers.append(worker)
+                    # The SDK has no per-call deadline; on timeout the worker thread
+                    # finishes in the background, still holding the slot, and its result is dropped
+                    result = await asyncio.wait_for(asyncio.shield(worker), timeout=settings.LLM_TIMEOUT_SECONDS)
+                self.breaker.record_success()
+                metrics.LLM_CALLS.inc(mode=mode, outcome="success")
+                return result
+            except UpstreamUnavailableError:
+                metrics.LLM_CALLS.inc(mode=mode, outcome="rejected")
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = UpstreamTimeoutError(settings.LLM_TIMEOUT_SECONDS)
+                if await self._should_retry(e, attempt):
+                    attempt += 1
+                    continue
+                metrics.LLM_CALLS.inc(mode=mode, outcome="error")
+                print(f"Error {action}: {str(e)}")
+                raise self._map_error(e, action)
+
+    @asynccontextmanager
+    async def _worker_slot(self, priority: int):
+        """A concurrency slot that stays taken until the worker threads started under it return.
+
+        A timed-out or abandoned SDK call cannot be interrupted and keeps its
+        thread busy. Holding its slot until then means a hung upstream pins at
+        most one thread per slot, and later calls wait their turn for a slot
+        instead of spending their own timeout queued behind it in the executor.
+        """
+        await self.limiter.acquire(priority)
+        workers: List[asyncio.Future] = []
+        try:
+            yield workers
+        finally:
+            if all(worker.done() for worker in workers):
+                self.limiter.release()
             else:
-                raise ValueError(f"Error generating text: {str(e)}")
+                running = asyncio.gather(*workers, return_exceptions=True)
+                running.add_done_callback(lambda _: self.limiter.release())
+
+    @staticmethod
+    def _timed(fn, stage: str = "llm_call"):
+        """Wrap a backend call to record its executor queue wait and upstream time for this request"""
+        stages = metrics.current_stages()
+        submitted = time.perf_counter()
+
+        def run(*args):
+            started = time.perf_counter()
+            metrics.record_stage("executor_queue", started - submitted, stages)
+            try:
+                return fn(*args)
+            finally:
+                metrics.record_stage(stage, time.perf_counter() - started, stages)
+        return run
 
-    async def generate_structured_text(self, prompt: str, format_instructions: str) -> str:
+    async def embed_texts(self, texts: Sequence[str], priority: int = Priority.DEFAULT) -> List[List[float]]:
+        """Embed texts with the configured embedding model, EMBEDDING_BATCH_SIZE texts per upstream call"""
+        vectors = []
+        for start in range(0, len(texts), settings.EMBEDDING_BATCH_SIZE):
+            batch = list(texts[start:start + settings.EMBEDDING_BATCH_SIZE])
+            tokens = sum(estimate_tokens(text) for text in batch)
+            vectors.extend(await self._call(self.backend.embed, batch, tokens, priority, "embed", "embedding text"))
+        return vectors
+
+    async def generate_structured_text(
+        self, prompt: str, format_instructions: str, priority: int = Priority.DEFAULT
+    ) -> str:
         """Generate text with specific formatting instructions"""
         full_prompt = (
             f"{format_instructions}\n\n"
             f"Important: Format your response exactly as requested. Do not include any additional text.\n\n"
             f"{prompt}"
         )
-        return await self.generate_text(full_prompt)
+        return await self.generate_text(full_prompt, priority)
 
-    async def analyze_with_context(self, prompt: str, context: str) -> str:
-        """Generate text with given context"""
-        full_prompt = (
-            f"Context:\n{context}\n\n"
-            f"Task:\n{prompt}\n\n"
-            f"Important: Provide a detailed, accurate response based on the context provided."
-        )
-        return await self.generate_text(full_prompt)
+    async def generate_text_stream(
+        self, prompt: str, priority: int = Priority.INTERACTIVE
+    ) -> AsyncGenerator[str, None]:
+        """Generate text using Gemini API with streaming, fanning identical in-flight prompts out"""
+        if prompt:
+            check_prompt(prompt)
+        if not settings.LLM_COALESCE:
+            stream = self._generate_text_stream(prompt, priority)
+        else:
+            key = fingerprint(settings.MODEL_NAME, prompt)
+            stream = self._stream_flights.subscribe(key, lambda: self._generate_text_stream(prompt, priority))
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _generate_text_stream(self, prompt: str, priority: int) -> AsyncGenerator[str, None]:
+        """Stream one upstream response, retrying transient failures until the first chunk is sent"""
+        if not prompt or len(prompt.strip()) == 0:
+            raise ValueError("Empty prompt provided")
 
-    async def generate_text_stream(self, prompt: str) -> AsyncGenerator[str, None]:
-        """Generate text using Gemini API with streaming"""
         try:
-            if not prompt or len(prompt.strip()) == 0:
-                raise ValueError("Empty prompt provided")
-
-            loop = asyncio.get_event_loop()
-            
-            def _stream_generate():
-                response = self.model.generate_content(prompt, stream=True)
-                return response
-
-            response_stream = await loop.run_in_executor(self._executor, _stream_generate)
-            
-            for chunk in response_stream:
-                if hasattr(chunk, 'text') and chunk.text:
-                    yield chunk.text
-                    
-        except Exception as e:
-            print(f"Error generating streaming text: {str(e)}")
-            if "API key not available" in str(e):
-                raise ValueError("Gemini API key not configured properly")
-            elif "Rate limit exceeded" in str(e):
-                raise ValueError("Gemini API rate limit exceeded. Please try again later")
-            else:
-                raise ValueError(f"Error generating streaming text: {str(e)}")
+            await asyncio.wait_for(self._stream_slots.acquire(priority), timeout=settings.STREAM_SLOT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise UpstreamUnavailableError(
+                "Too many concurrent streams. Please try again shortly", retry_after=1
+            )
 
-    async def analyze_with_context_stream(self, prompt: str, context: str) -> AsyncGenerator[str, None]:
-        """Generate streaming text with given context"""
-        full_prompt = (
-            f"Context:\n{context}\n\n"
-            f"Task:\n{prompt}\n\n"
-            f"Important: Provide a detailed, accurate response based on the context provided."
-        )
-        async for chunk in self.generate_text_stream(full_prompt):
-            yield chunk
\ No newline at end of file
+        try:
+            tokens = estimate_tokens(prompt)
+            attempt = 0
+            while True:
+                self.breaker.check()
+                started = False
+                try:
+                    queued = time.perf_counter()
+                    async with self._worker_slot(priority) as workers:
+                        await self.rate_limiter.acquire(tokens)
+                        begun = time.perf_counter()
+                        metrics.record_stage("llm_queue", begun - queued)
+                        metrics.LLM_TOKENS.inc(tokens, direction="prompt")
+                        output = []
+                        stream = self._stream_attempt(prompt, workers)
+                        try:
+                            async for chunk in stream:
+                                if not started:
+                                    metrics.record_stage("llm_first_chunk", time.perf_counter() - begun)
+                                started = True
+                                output.append(chunk)
+                                yield chunk
+                        finally:
+                            # Stop the producer before the slot is handed back
+                            await stream.aclose()
+                    self.breaker.record_success()
+                    metrics.LLM_CALLS.inc(mode="stream", outcome="success")
+                    metrics.LLM_TOKENS.inc(estimate_tokens("".join(output)), direction="completion")
+                    return
+                except UpstreamUnavailableError:
+                    metrics.LLM_CALLS.inc(mode="stream", outcome="rejected")
+                    raise
+                except Exception as e:
+                    # Chunks already sent cannot be taken back, so only a stream that
+                    # failed before its first chunk is retried
+                    if not started and await self._should_retry(e, attempt):
+                        attempt += 1
+                        continue
+                    if started and is_transient(e):
+                        self.breaker.record_failure()
+                    metrics.LLM_CALLS.inc(mode="stream", outcome="error")
+                    print(f"Error generating streaming text: {str(e)}")
+                    raise self._map_error(e, "generating streaming text")
+        finally:
+            self._stream_slots.release()
+
+    async def _stream_attempt(self, prompt: str, workers: List[asyncio.Future]) -> AsyncGenerator[str, None]:
+        """One upstream streaming call.
+
+        The blocking backend iterator runs on a worker thread and hands chunks to the
+        event loop through a bounded queue, so slow network reads never stall
+        the loop and the thread waits whenever the queue is full.
+        Closing the generator (e.g. the SSE client disconnected) stops the producer;
+        the thread is added to workers so its slot is held until it returns.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_QUEUE_SIZE)
+        cancelled = threading.Event()
+
+        def _put(item) -> bool:
+            # Block the producer thread while the queue is full, but give up once cancelled
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not cancelled.is_set():
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except FuturesTimeoutError:
+                    continue
+            future.cancel()
+            return False
+
+        def _produce():
+            try:
+                for chunk in self.backend.stream(prompt):
+                    if cancelled.is_set():
+                        return
+                    if not _put(("chunk", chunk)):
+                        return
+                _put(("done", None))
+            except Exception as e:
+                _put(("error", e))
+
+        workers.append(loop.run_in_executor(self._executor, self._timed(_produce, "llm_stream")))
+        try:
+            while True:
+                try:
+                    kind, payload = await asyncio.wait_for(queue.get(), timeout=settings.LLM_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    raise UpstreamTimeoutError(settings.LLM_TIMEOUT_SECONDS)
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    break
+        finally:
+            # The worker thread finishes its current read in the background
+            cancelled.set()
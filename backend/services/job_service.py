@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+from config import settings
+from models.job import JobStatus
+from services.storage import SQLitePool
+
+ProgressCallback = Callable[[float, str], Awaitable[None]]
+JobHandler = Callable[[dict, ProgressCallback], Awaitable[Any]]
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+_COLUMNS = "id, kind, status, progress, message, error, created_at, updated_at"
+
+
+class JobStore:
+    """SQLite-backed job table, so job state survives restarts without an external broker.
+
+    The file may be shared by several server processes: a job is run by
+    whichever process claims it first, and the owner refreshes heartbeat_at
+    while it runs so others can tell a live job from one whose process died.
+    """
+
+    def __init__(self, db_path: str = None):
+        self._db = SQLitePool(db_path or settings.JOBS_DB_PATH)
+        self._db.execute(self._create_schema)
+
+    @staticmethod
+    def _create_schema(conn) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, message TEXT, "
+            "payload TEXT NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT, heartbeat_at REAL)"
+        )
+        # Job files created before jobs were claimed by owner
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (fingerprint, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at)")
+
+    @staticmethod
+    def _to_status(row) -> JobStatus:
+        keys = _COLUMNS.split(", ")
+        return JobStatus(**dict(zip(keys, row)))
+
+    async def create(self, job_id: str, kind: str, fingerprint: str, payload: dict) -> None:
+        now = time.time()
+        await self._db.run(lambda conn: conn.execute(
+            "INSERT INTO jobs (id, kind, fingerprint, status, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, fingerprint, QUEUED, json.dumps(payload), now, now),
+        ))
+
+    async def find_active(self, fingerprint: str) -> Optional[str]:
+        row = await self._db.run(lambda conn: conn.execute(
+            "SELECT id FROM jobs WHERE fingerprint = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+            (fingerprint, QUEUED, RUNNING),
+        ).fetchone())
+        return row[0] if row else None
+
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        row = await self._db.run(lambda conn: conn.execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone())
+        return self._to_status(row) if row else None
+
+    async def get_payload(self, job_id: str) -> tuple:
+        return await self._db.run(lambda conn: conn.execute(
+            "SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone())
+
+    async def get_result(self, job_id: str) -> Any:
+        row = await self._db.run(lambda conn: conn.execute(
+            "SELECT result FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone())
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = list(fields.values()) + [job_id]
+        await self._db.run(lambda conn: conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?", values
+        ))
+
+    async def claim(self, job_id: str, owner: str) -> bool:
+        """Mark a queued job as running for owner; False if another process got it first"""
+        now = time.time()
+
+        def _claim(conn):
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, heartbeat_at = ?, progress = 0, message = ?, "
+                "updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, owner, now, "Running", now, job_id, QUEUED),
+            )
+            return cursor.rowcount > 0
+
+        return await self._db.run(_claim)
+
+    async def heartbeat(self, owner: str) -> None:
+        await self._db.run(lambda conn: conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = ?", (time.time(), owner, RUNNING)
+        ))
+
+    async def release(self, job_id: str, owner: str) -> None:
+        """Put a job this process was running back in the queue, e.g. on shutdown"""
+        await self._db.run(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, owner = NULL, message = ?, updated_at = ? "
+            "WHERE id = ? AND owner = ? AND status = ?",
+            (QUEUED, "Interrupted, will resume", time.time(), job_id, owner, RUNNING),
+        ))
+
+    async def recover(self, stale_before: float) -> list:
+        """Requeue running jobs whose owner stopped sending heartbeats; returns every job waiting to run.
+
+        Queued jobs are returned too, since the process that queued one may have
+        stopped before running it; claim() keeps two processes from both running it.
+        """
+
+        def _recover(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, message = ?, updated_at = ? "
+                "WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (QUEUED, "Interrupted, will resume", time.time(), RUNNING, stale_before),
+            )
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+            return [row[0] for row in rows]
+
+        return await self._db.run(_recover)
+
+    def purge_finished(self, older_than: float) -> None:
+        self._db.execute(lambda conn: conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (SUCCEEDED, FAILED, older_than),
+        ))
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class JobService:
+    """Bounded worker pool that runs long LLM tasks outside the HTTP request.
+
+    Identical in-flight submissions (same kind and payload) share one job.
+    Every server process sharing the job file runs one of these; jobs are
+    claimed atomically, and a job whose owner has sent no heartbeat for
+    JOB_LEASE_SECONDS is requeued for the others.
+    """
+
+    def __init__(self, store: JobStore, workers: int = None):
+        self.store = store
+        self.workers = workers or settings.JOB_WORKERS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queued = set()
+        self._tasks = []
+        # Only kept alive while an SSE stream is waiting on it
+        self._changed: "weakref.WeakValueDictionary[str, asyncio.Event]" = weakref.WeakValueDictionary()
+        self._submit_lock = asyncio.Lock()
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    @staticmethod
+    def fingerprint(kind: str, payload: dict) -> str:
+        canonical = json.dumps({"kind": kind, "payload": payload}, sort_keys=True)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def start(self) -> None:
+        self.store.purge_finished(time.time() - settings.JOB_RETENTION_SECONDS)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: dict) -> tuple:
+        """Queue a job, returning (job_id, deduplicated)"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job type: {kind}")
+
+        fingerprint = self.fingerprint(kind, payload)
+        async with self._submit_lock:
+            existing = await self.store.find_active(fingerprint)
+            if existing:
+                return existing, True
+            job_id = str(uuid.uuid4())
+            await self.store.create(job_id, kind, fingerprint, payload)
+        self._enqueue(job_id)
+        return job_id, False
+
+    async def get(self, job_id: str) -> Optional[JobStatus]:
+        return await self.store.get(job_id)
+
+    async def get_result(self, job_id: str) -> Any:
+        return await self.store.get_result(job_id)
+
+    def watch(self, job_id: str) -> asyncio.Event:
+        """Event set on the job's next update; take it before reading status to avoid missing one"""
+        event = self._changed.get(job_id)
+        if event is None:
+            event = asyncio.Event()
+            self._changed[job_id] = event
+        return event
+
+    def _notify(self, job_id: str) -> None:
+        # Wake anyone streaming this job's progress
+        event = self._changed.pop(job_id, None)
+        if event:
+            event.set()
+
+    async def _update(self, job_id: str, **fields: Any) -> None:
+        await self.store.update(job_id, **fields)
+        self._notify(job_id)
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _maintain(self) -> None:
+        """Keep this process's running jobs alive and pick up jobs other processes left behind"""
+        while True:
+            try:
+                await self.store.heartbeat(self.owner)
+                for job_id in await self.store.recover(time.time() - settings.JOB_LEASE_SECONDS):
+                    self._enqueue(job_id)
+            except Exception as e:
+                print(f"Job maintenance error: {str(e)}")
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 4)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job worker error for {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        if not await self.store.claim(job_id, self.owner):
+            # Finished, or already running in another process
+            return
+        self._notify(job_id)
+        kind, payload = await self.store.get_payload(job_id)
+        payload = json.loads(payload)
+
+        async def report(progress: float, message: str) -> None:
+            await self._update(job_id, progress=progress, message=message)
+
+        try:
+            result = await self._handlers[kind](payload, report)
+        except asyncio.CancelledError:
+            await self.store.release(job_id, self.owner)
+            self._notify(job_id)
+            raise
+        except HTTPException as e:
+            await self._update(job_id, status=FAILED, error=str(e.detail), message="Failed")
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) failed: {str(e)}")
+            await self._update(job_id, status=FAILED, error=str(e), message="Failed")
+        else:
+            await self._update(job_id, status=SUCCEEDED, progress=1.0, result=result, message="Done")
+
+
+def register_study_handlers(jobs: JobService, quiz_service, document_service) -> None:
+    """Wire the quiz and summary job types to the existing services"""
+
+    async def run_quiz(payload: dict, report: ProgressCallback) -> dict:
+        text = await document_service.store.resolve(payload.get("text"), payload.get("document_id"))
+        await report(0.1, "Generating quiz questions")
+        quiz = await quiz_service.generate_quiz(text, payload["num_questions"], payload.get("fresh", False))
+        return quiz.model_dump()
+
+    async def run_summary(payload: dict, report: ProgressCallback) -> dict:
+        text = await document_service.store.resolve(payload.get("text"), payload.get("document_id"))
+        await report(0.1, "Summarizing document")
+        summary = await document_service.generate_summary(text, payload.get("fresh", False))
+        return summary.model_dump()
+
+    jobs.register("quiz", run_quiz)
+    jobs.register("summary", run_summary)
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Iterator, List, Sequence
+from config import settings
+
+
+class ModelBackend:
+    """Blocking model client used by GeminiService from its worker threads"""
+
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        raise NotImplementedError
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Load whatever the first call would otherwise pay for"""
+
+
+class GeminiBackend(ModelBackend):
+    """The Gemini API. The SDK and its gRPC stack are imported on first use, not at startup"""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = None):
+        if not settings.GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY is not set; use LLM_BACKEND=stub to run without one")
+        self.model_name = model_name or settings.MODEL_NAME
+        self._genai = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=settings.GEMINI_API_KEY)
+                self._genai = genai
+                self._model = genai.GenerativeModel(self.model_name)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._load()
+        return self._model
+
+    def warm_up(self) -> None:
+        self._load()
+
+    def generate(self, prompt: str) -> str:
+        response = self.model.generate_content(prompt)
+        if not response:
+            raise ValueError("No response received from Gemini API")
+        if not hasattr(response, 'text'):
+            raise ValueError(f"Unexpected response format: {response}")
+        return response.text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self.model.generate_content(prompt, stream=True):
+            if hasattr(chunk, 'text') and chunk.text:
+                yield chunk.text
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        self._load()
+        # A list of contents is sent as one batch request and returns one embedding per text
+        result = self._genai.embed_content(model=settings.EMBEDDING_MODEL, content=list(texts))
+        return result["embedding"]
+
+
+_QUESTION_COUNT_RE = re.compile(r"exactly (\d+) multiple-choice questions")
+_WORD_RE = re.compile(r"[A-Za-z]{5,}")
+
+
+class StubUnavailableError(Exception):
+    """Injected failure; reads as a transient 503 to the retry logic"""
+
+
+class StubBackend(ModelBackend):
+    """Deterministic local model for development and load tests.
+
+    Replies are derived from a hash of the prompt and shaped like the real
+    answers each service expects (summary sections, quiz JSON, bullet notes,
+    prose), so every endpoint works end to end. latency is the time to the
+    first chunk, chunk_delay the gap between chunks, and error_rate the
+    share of calls that fail with a transient error, drawn from a seeded RNG.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency: float = None,
+        chunk_delay: float = None,
+        chunk_chars: int = None,
+        error_rate: float = None,
+        seed: int = None,
+    ):
+        self.latency = settings.STUB_LATENCY_SECONDS if latency is None else latency
+        self.chunk_delay = settings.STUB_CHUNK_DELAY if chunk_delay is None else chunk_delay
+        self.chunk_chars = chunk_chars or settings.STUB_CHUNK_CHARS
+        self.error_rate = settings.STUB_ERROR_RATE if error_rate is None else error_rate
+        self._random = random.Random(settings.STUB_SEED if seed is None else seed)
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self) -> None:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_rate:
+            raise StubUnavailableError("503 Stub backend unavailable (injected error)")
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+
+    def generate(self, prompt: str) -> str:
+        self._maybe_fail()
+        text = self.reply(prompt)
+        # A unary call costs the time to stream the whole answer
+        time.sleep(self.latency + self.chunk_delay * (len(self._chunks(text)) - 1))
+        return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        self._maybe_fail()
+        time.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(self.reply(prompt))):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield chunk
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            vectors.append([(b - 128) / 128 for b in digest])
+        return vectors
+
+    @staticmethod
+    def reply(prompt: str) -> str:
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        words = _WORD_RE.findall(prompt[-4000:]) or ["concept", "process", "structure", "evidence"]
+
+        def phrase(n: int) -> str:
+            return " ".join(rng.choice(words) for _ in range(n))
+
+        match = _QUESTION_COUNT_RE.search(prompt)
+        if match:
+            questions = [
+                {
+                    "question": f"Which statement about {phrase(3)} is correct? ({rng.getrandbits(32):08x})",
+                    "options": [phrase(4) for _ in range(4)],
+                    "correctAnswer": rng.randrange(4),
+                    "explanation": f"The text explains {phrase(8)}.",
+                }
+                for _ in range(int(match.group(1)))
+            ]
+            return json.dumps(questions, indent=2)
+        if "Key Takeaways" in prompt:
+            notes = "\n".join(f"- {phrase(10)}" for _ in range(6))
+            takeaways = "\n".join(f"- {phrase(25)}" for _ in range(4))
+            return f"Quick Notes:\n{notes}\n\nKey Takeaways:\n{takeaways}"
+        if "bullet points only" in prompt or "running summary" in prompt:
+            return "\n".join(f"- {phrase(12)}" for _ in range(8))
+        return "\n\n".join(f"**{phrase(2).title()}**: {phrase(40)}." for _ in range(3))
+
+
+def create_backend() -> ModelBackend:
+    """Backend selected by LLM_BACKEND"""
+    if settings.LLM_BACKEND == "stub":
+        return StubBackend()
+    if settings.LLM_BACKEND == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown LLM_BACKEND: {settings.LLM_BACKEND!r} (expected 'gemini' or 'stub')")
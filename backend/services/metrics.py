@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from opentelemetry import trace as _otel_trace
+except ImportError:  # tracing is optional
+    _otel_trace = None
+
+# Seconds; covers sub-millisecond prompt assembly up to multi-minute map-reduce summaries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Per-request list of (stage, seconds), reported by the debug Server-Timing header
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+_tracer = _otel_trace.get_tracer("studyai") if _otel_trace else None
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A settable gauge, or one read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+_INF_LABEL = 'le="+Inf"'
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts, then sum and count
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in series:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_LABEL)} {_format_value(values[-1])}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(values[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(values[-1])}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "studyai_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "studyai_http_request_seconds", "Time to the response headers by route", ["method", "route"]
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "studyai_http_requests_in_flight", "HTTP requests currently being served"
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "studyai_stage_seconds", "Time spent per processing stage", ["stage"]
+))
+STREAM_FIRST_CHUNK = REGISTRY.register(Histogram(
+    "studyai_stream_first_chunk_seconds", "Time from request to the first streamed event", ["endpoint"]
+))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "studyai_llm_calls_in_flight", "Upstream model calls holding a concurrency slot"
+))
+LLM_WAITING = REGISTRY.register(Gauge(
+    "studyai_llm_calls_waiting", "Calls queued for a concurrency slot or for rate-limit quota", ["queue"]
+))
+EXECUTOR_QUEUE = REGISTRY.register(Gauge(
+    "studyai_executor_queue_depth", "Work items submitted to a pool but not yet started", ["pool"]
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "studyai_llm_tokens_total", "Estimated tokens sent to and received from the model", ["direction"]
+))
+LLM_CALLS = REGISTRY.register(Counter(
+    "studyai_llm_calls_total", "Upstream model calls by mode and outcome", ["mode", "outcome"]
+))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "studyai_llm_retries_total", "Upstream calls retried after a transient error"
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "studyai_cache_requests_total", "Response cache lookups by kind and result", ["kind", "result"]
+))
+
+
+def start_request_timing() -> List[Tuple[str, float]]:
+    stages: List[Tuple[str, float]] = []
+    _request_stages.set(stages)
+    return stages
+
+
+def record_stage(name: str, seconds: float, stages: Optional[List[Tuple[str, float]]] = None) -> None:
+    """Observe a stage duration; pass stages when recording from a worker thread"""
+    STAGE_LATENCY.observe(seconds, stage=name)
+    if stages is None:
+        stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+def current_stages() -> Optional[List[Tuple[str, float]]]:
+    return _request_stages.get()
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Time a block as a processing stage, inside an OpenTelemetry span when tracing is installed"""
+    with ExitStack() as stack:
+        if _tracer:
+            stack.enter_context(_tracer.start_as_current_span(f"studyai.{name}", attributes=attributes))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record_stage(name, time.perf_counter() - start)
+
+
+def server_timing(stages: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value, summing repeated stages (e.g. parallel section calls)"""
+    totals: Dict[str, List[float]] = {}
+    for name, seconds in stages:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    return ", ".join(
+        f'{name};dur={total * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (total, count) in totals.items()
+    )
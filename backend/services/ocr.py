@@ -0,0 +1,190 @@
+"""OCR fallback for PDF pages that have no text layer (scanned notes).
+
+The module-level functions run in the OCR process pool: they read the
+page's embedded images with PyPDF2 and pass them to an engine. Engines are
+looked up by name in ENGINES, so another local engine can be added next to
+Tesseract. OCRService is the event-loop side: it checks the per-page cache,
+caps concurrent work and reports pages as they finish.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import io
+import shutil
+import time
+from concurrent.futures import Executor
+from typing import AsyncGenerator, Dict, List, Optional, Sequence, Tuple
+from config import settings
+from services.cache import ResponseCache
+from services import metrics
+
+# Bump when image handling or engine settings change so cached page text is not reused
+OCR_VERSION = "1"
+
+
+class OCREngine:
+    name = "base"
+    # Modules and executables the engine needs; checked before the pool is created
+    modules: Tuple[str, ...] = ()
+    executable: Optional[str] = None
+
+    def __init__(self, language: str):
+        self.language = language
+
+    def recognize(self, image) -> str:
+        """Text in a PIL image"""
+        raise NotImplementedError
+
+
+class TesseractEngine(OCREngine):
+    name = "tesseract"
+    modules = ("pytesseract", "PIL")
+    executable = "tesseract"
+
+    def recognize(self, image) -> str:
+        import pytesseract
+
+        return pytesseract.image_to_string(image, lang=self.language)
+
+
+ENGINES = {engine.name: engine for engine in (TesseractEngine,)}
+
+
+def missing_requirements(engine_name: str) -> List[str]:
+    engine = ENGINES.get(engine_name)
+    if engine is None:
+        return [f"unknown engine {engine_name!r}"]
+    missing = [module for module in engine.modules if importlib.util.find_spec(module) is None]
+    if engine.executable and shutil.which(engine.executable) is None:
+        missing.append(f"{engine.executable} executable")
+    return missing
+
+
+def _open_pdf(path: str):
+    import PyPDF2
+
+    return PyPDF2.PdfReader(path)
+
+
+def image_hashes(path: str, page_numbers: Sequence[int]) -> Dict[int, str]:
+    """Hash of each page's embedded images; pages without images are left out"""
+    # Parsed once for every page of the task
+    reader = _open_pdf(path)
+    hashes = {}
+    for page_number in page_numbers:
+        images = reader.pages[page_number].images
+        if not images:
+            continue
+        digest = hashlib.sha256()
+        for image in images:
+            digest.update(image.data)
+        hashes[page_number] = digest.hexdigest()
+    return hashes
+
+
+def recognize_batch(path: str, page_numbers: Sequence[int], engine_name: str, language: str) -> List[Tuple[int, str]]:
+    """(page_number, text) for each page; the PDF is parsed once per batch and unreadable pages are skipped"""
+    from PIL import Image
+
+    engine = ENGINES[engine_name](language)
+    reader = _open_pdf(path)
+    results = []
+    for page_number in page_numbers:
+        try:
+            texts = []
+            for image in reader.pages[page_number].images:
+                with Image.open(io.BytesIO(image.data)) as picture:
+                    texts.append(engine.recognize(picture).strip())
+        except Exception as e:
+            print(f"Error running OCR on PDF page {page_number}: {str(e)}")
+            continue
+        results.append((page_number, "\n".join(text for text in texts if text)))
+    return results
+
+
+class OCRService:
+    """Runs OCR for image-only pages in its own process pool, so text PDFs never wait behind it"""
+
+    def __init__(self, pool: Executor, cache: Optional[ResponseCache] = None, engine: str = None):
+        self.pool = pool
+        self.cache = cache
+        self.engine = engine or settings.OCR_ENGINE
+        self.language = settings.OCR_LANGUAGE
+        self.pages_recognized = 0
+        self.cache_hits = 0
+        if hasattr(pool, "_pending_work_items"):
+            metrics.EXECUTOR_QUEUE.set_function(
+                lambda: max(0, len(pool._pending_work_items) - pool._max_workers), pool="ocr"
+            )
+
+    def _cache_key(self, image_hash: str) -> str:
+        return ResponseCache.make_key(
+            "ocr_page", image_hash, OCR_VERSION, engine=self.engine, language=self.language
+        )
+
+    async def recognize_pages(self, path: str, page_numbers: Sequence[int]) -> AsyncGenerator[Tuple[int, str], None]:
+        """Yield (page_number, text) for each image page as it is recognized, cached pages first"""
+        page_numbers = list(page_numbers)[:settings.OCR_MAX_PAGES]
+        if not page_numbers:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            hashes = await loop.run_in_executor(self.pool, image_hashes, path, page_numbers)
+        except Exception as e:
+            print(f"Error reading page images for OCR: {str(e)}")
+            return
+
+        misses = []
+        for page_number, image_hash in hashes.items():
+            cached = await self.cache.get(self._cache_key(image_hash)) if self.cache else None
+            if cached is not None:
+                self.cache_hits += 1
+                yield page_number, cached
+            else:
+                misses.append(page_number)
+
+        async def recognize(batch: List[int]) -> List[Tuple[int, str]]:
+            started = time.perf_counter()
+            results = await loop.run_in_executor(
+                self.pool, recognize_batch, path, batch, self.engine, self.language
+            )
+            metrics.record_stage("ocr_page", (time.perf_counter() - started) / len(batch))
+            return results
+
+        # Batches are small enough to keep every pool worker busy; queued ones are dropped if the caller stops
+        size = max(1, min(settings.PDF_PAGE_BATCH, -(-len(misses) // settings.OCR_WORKERS)))
+        pending = [asyncio.ensure_future(recognize(misses[i:i + size])) for i in range(0, len(misses), size)]
+        try:
+            for next_batch in asyncio.as_completed(pending):
+                try:
+                    results = await next_batch
+                except Exception as e:
+                    print(f"Error running OCR on PDF pages: {str(e)}")
+                    continue
+                for page_number, text in results:
+                    self.pages_recognized += 1
+                    if self.cache:
+                        await self.cache.set(self._cache_key(hashes[page_number]), text)
+                    yield page_number, text
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {"engine": self.engine, "pages_recognized": self.pages_recognized, "cache_hits": self.cache_hits}
+
+
+def create_ocr_service(cache: Optional[ResponseCache] = None) -> Optional[OCRService]:
+    """OCR service with its own worker pool, or None when OCR is off or the engine is not installed"""
+    if settings.OCR_ENGINE == "none":
+        return None
+    missing = missing_requirements(settings.OCR_ENGINE)
+    if missing:
+        print(f"OCR fallback disabled, missing: {', '.join(missing)}")
+        return None
+    from services import pdf_extraction
+
+    return OCRService(pdf_extraction.create_pool(settings.OCR_WORKERS), cache)
@@ -0,0 +1,40 @@
+"""Blocking PDF helpers that run in the extraction process pool.
+
+They take a file path rather than bytes so only the path crosses the
+process boundary; every worker opens the spooled upload itself. PyPDF2 is
+imported on first use, so the API process itself never loads it.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+
+def create_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Extraction pool whose workers fork from a small server process rather than from the app.
+
+    Workers start on demand and only carry this module and PyPDF2, instead
+    of a copy of the API process with its model client and caches.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=max_workers)
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__, "PyPDF2"])
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def warm_up() -> None:
+    import PyPDF2  # noqa: F401
+
+
+def count_pages(path: str) -> int:
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract text for pages [start, end) as (page_number, text) pairs"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
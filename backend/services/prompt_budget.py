@@ -0,0 +1,125 @@
+import hashlib
+import re
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from config import settings
+
+# Words, numbers and individual punctuation marks; close to SentencePiece counts for English prose
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_DIRECT_LIMIT = 2048
+
+# Per-request running total of estimated prompt tokens, reported by PromptTokensMiddleware
+_request_tokens: ContextVar[Optional[List[int]]] = ContextVar("request_prompt_tokens", default=None)
+
+
+class PromptTooLargeError(HTTPException):
+    def __init__(self, estimated: int, limit: int):
+        self.estimated = estimated
+        self.limit = limit
+        super().__init__(
+            status_code=413,
+            detail=(
+                f"Request is too large for the model: about {estimated} prompt tokens, "
+                f"limit is {limit}. Please shorten the text or upload it as a document."
+            ),
+        )
+
+
+def _count(text: str) -> int:
+    pieces = 0
+    for match in _PIECE_RE.finditer(text):
+        # Long words are split into several sub-word tokens
+        pieces += 1 + (match.end() - match.start()) // 8
+    return max(pieces, len(text) // 4)
+
+
+_token_cache: "Dict[str, int]" = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local token estimate; large texts are cached by content hash"""
+    if not text:
+        return 0
+    if len(text) <= _DIRECT_LIMIT:
+        return _count(text)
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    tokens = _token_cache.get(digest)
+    if tokens is None:
+        tokens = _count(text)
+        if len(_token_cache) >= 4096:
+            _token_cache.pop(next(iter(_token_cache)))
+        _token_cache[digest] = tokens
+    return tokens
+
+
+def prompt_budget() -> int:
+    """Tokens available for the prompt after reserving room for the answer"""
+    return settings.MODEL_CONTEXT_WINDOW - settings.MAX_OUTPUT_TOKENS
+
+
+def check_prompt(prompt: str) -> int:
+    """Reject prompts that cannot fit before spending a round-trip, and record the estimate"""
+    tokens = estimate_tokens(prompt)
+    limit = prompt_budget()
+    if tokens > limit:
+        raise PromptTooLargeError(tokens, limit)
+    holder = _request_tokens.get()
+    if holder is not None:
+        holder[0] += tokens
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Trim text to roughly max_tokens, cutting on a whitespace boundary"""
+    if max_tokens <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    max_chars = int(len(text) * max_tokens / tokens)
+    if keep == "tail":
+        cut = text[len(text) - max_chars:]
+        space = cut.find(" ")
+        return cut[space + 1:] if 0 <= space < 64 else cut
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return cut[:space] if space > max_chars - 64 else cut
+
+
+class PromptPart:
+    def __init__(self, name: str, text: str, priority: int = 0, required: bool = False, keep: str = "head"):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority  # lower is kept first
+        self.required = required
+        self.keep = keep  # which end survives truncation
+
+
+def fit_parts(parts: List[PromptPart], budget: int = None) -> Dict[str, str]:
+    """Fit parts into the budget: required parts whole, then optional ones by priority, truncating the last"""
+    budget = budget if budget is not None else prompt_budget()
+    fitted = {part.name: "" for part in parts}
+
+    used = 0
+    for part in parts:
+        if part.required:
+            fitted[part.name] = part.text
+            used += estimate_tokens(part.text)
+    if used > budget:
+        raise PromptTooLargeError(used, budget)
+
+    for part in sorted((p for p in parts if not p.required), key=lambda p: p.priority):
+        remaining = budget - used
+        if remaining <= 0:
+            break
+        text = truncate_to_tokens(part.text, remaining, part.keep)
+        fitted[part.name] = text
+        used += estimate_tokens(text)
+    return fitted
+
+
+def start_request_tracking() -> List[int]:
+    holder = [0]
+    _request_tokens.set(holder)
+    return holder
@@ -0,0 +1,107 @@
+import json
+import re
+from typing import Any, List, Union
+from models.quiz import Question
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+REQUIRED_FIELDS = ["question", "options", "correctAnswer", "explanation"]
+
+
+class QuestionStreamParser:
+    """Incrementally extracts top-level JSON objects from streamed model output.
+
+    A single linear scan tracks string/escape state and brace depth, so a
+    question is available as soon as its closing brace arrives. Braces inside
+    strings are handled correctly and there is no regex backtracking. Prose
+    or code fences around the array are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = -1
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Union[dict, ValueError]]:
+        """Add streamed text and return every object completed by it (or the error parsing it)"""
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append(self._decode(buffer[self._start:i + 1]))
+                    self._start = -1
+
+        # Drop text that can no longer be part of an object
+        if self._depth == 0:
+            self._buffer = ""
+            self._pos = 0
+        else:
+            self._buffer = buffer[self._start:]
+            self._pos = len(self._buffer)
+            self._start = 0
+        return completed
+
+    @staticmethod
+    def _decode(raw: str) -> Union[dict, ValueError]:
+        for candidate in (raw, _TRAILING_COMMA_RE.sub(r"\1", raw)):
+            try:
+                data = json.loads(candidate)
+                if isinstance(data, dict):
+                    return data
+                return ValueError("Question must be a JSON object")
+            except json.JSONDecodeError:
+                continue
+        return ValueError(f"Malformed question JSON: {raw[:80]}...")
+
+
+def validate_question(data: Any, question_id: str) -> Question:
+    """Validate one parsed object into a Question, tolerating small formatting slips"""
+    if isinstance(data, ValueError):
+        raise data
+    if "correctAnswer" not in data and "correct_answer" in data:
+        data["correctAnswer"] = data["correct_answer"]
+
+    missing_fields = [f for f in REQUIRED_FIELDS if f not in data]
+    if missing_fields:
+        raise ValueError(f"Question is missing required fields: {missing_fields}")
+
+    if not isinstance(data["options"], list) or len(data["options"]) != 4:
+        raise ValueError("Question must have exactly 4 options")
+
+    correct_answer = data["correctAnswer"]
+    if isinstance(correct_answer, str) and correct_answer.strip().isdigit():
+        correct_answer = int(correct_answer.strip())
+    if not isinstance(correct_answer, int) or isinstance(correct_answer, bool) or not (0 <= correct_answer <= 3):
+        raise ValueError("Question has invalid correctAnswer (must be 0-3)")
+
+    if not str(data["question"]).strip():
+        raise ValueError("Question text is empty")
+
+    return Question(
+        id=question_id,
+        question=str(data["question"]).strip(),
+        options=[str(option) for option in data["options"]],
+        correct_answer=correct_answer,
+        explanation=str(data["explanation"])
+    )
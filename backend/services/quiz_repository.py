@@ -0,0 +1,178 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import settings
+from models.quiz import Quiz, Question
+from services.storage import SQLitePool
+
+
+class QuizRepository:
+    """Storage interface for generated quizzes"""
+
+    async def save(self, quiz: Quiz) -> None:
+        raise NotImplementedError
+
+    async def get_quiz(self, quiz_id: str) -> Optional[Quiz]:
+        raise NotImplementedError
+
+    async def get_question(self, quiz_id: str, question_id: str) -> Optional[Question]:
+        quiz = await self.get_quiz(quiz_id)
+        if not quiz:
+            return None
+        return next((q for q in quiz.questions if q.id == question_id), None)
+
+    def purge_expired(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _QuizCache:
+    """Bounded LRU of quizzes with their questions indexed by id"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # quiz_id -> (expires_at, quiz, {question_id: question})
+
+    def get(self, quiz_id: str) -> Optional[tuple]:
+        entry = self._entries.get(quiz_id)
+        if not entry:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[quiz_id]
+            return None
+        self._entries.move_to_end(quiz_id)
+        return entry
+
+    def put(self, quiz: Quiz, expires_at: float) -> tuple:
+        entry = (expires_at, quiz, {q.id: q for q in quiz.questions})
+        self._entries[quiz.id] = entry
+        self._entries.move_to_end(quiz.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+
+class InMemoryQuizRepository(QuizRepository):
+    """Process-local store; only suitable for a single worker"""
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        self.ttl_seconds = ttl_seconds or settings.QUIZ_TTL_SECONDS
+        self._cache = _QuizCache(max_entries or settings.QUIZ_CACHE_SIZE)
+
+    async def save(self, quiz: Quiz) -> None:
+        self._cache.put(quiz, time.time() + self.ttl_seconds)
+
+    async def get_quiz(self, quiz_id: str) -> Optional[Quiz]:
+        entry = self._cache.get(quiz_id)
+        return entry[1] if entry else None
+
+    async def get_question(self, quiz_id: str, question_id: str) -> Optional[Question]:
+        entry = self._cache.get(quiz_id)
+        return entry[2].get(question_id) if entry else None
+
+
+class SQLiteQuizRepository(QuizRepository):
+    """SQLite-backed store shared by every uvicorn worker on the host.
+
+    Questions are keyed on (quiz_id, question_id) so answer checks are index
+    lookups. A bounded read-through cache serves repeat checks in memory.
+    """
+
+    def __init__(self, db_path: str = None, ttl_seconds: float = None, cache_size: int = None):
+        self.ttl_seconds = ttl_seconds or settings.QUIZ_TTL_SECONDS
+        self._db = SQLitePool(db_path or settings.QUIZ_DB_PATH)
+        self._db.execute(self._create_schema)
+        self._cache = _QuizCache(cache_size or settings.QUIZ_CACHE_SIZE)
+
+    @staticmethod
+    def _create_schema(conn) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quizzes ("
+            "id TEXT PRIMARY KEY, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS quizzes_expires_at ON quizzes (expires_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quiz_questions ("
+            "quiz_id TEXT NOT NULL, question_id TEXT NOT NULL, position INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, PRIMARY KEY (quiz_id, question_id)) WITHOUT ROWID"
+        )
+
+    async def save(self, quiz: Quiz) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        rows = [
+            (quiz.id, q.id, position, q.model_dump_json())
+            for position, q in enumerate(quiz.questions)
+        ]
+
+        def _insert(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO quizzes (id, created_at, expires_at) VALUES (?, ?, ?)",
+                (quiz.id, now, expires_at),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO quiz_questions (quiz_id, question_id, position, payload) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+        await self._db.run(_insert)
+        self._cache.put(quiz, expires_at)
+
+    async def _load(self, quiz_id: str) -> Optional[tuple]:
+        entry = self._cache.get(quiz_id)
+        if entry:
+            return entry
+
+        def _select(conn):
+            quiz_row = conn.execute(
+                "SELECT expires_at FROM quizzes WHERE id = ? AND expires_at > ?", (quiz_id, time.time())
+            ).fetchone()
+            if not quiz_row:
+                return None
+            question_rows = conn.execute(
+                "SELECT payload FROM quiz_questions WHERE quiz_id = ? ORDER BY position", (quiz_id,)
+            ).fetchall()
+            return quiz_row[0], question_rows
+
+        found = await self._db.run(_select)
+        if not found:
+            return None
+        expires_at, question_rows = found
+        quiz = Quiz(id=quiz_id, questions=[Question(**json.loads(row[0])) for row in question_rows])
+        return self._cache.put(quiz, expires_at)
+
+    async def get_quiz(self, quiz_id: str) -> Optional[Quiz]:
+        entry = await self._load(quiz_id)
+        return entry[1] if entry else None
+
+    async def get_question(self, quiz_id: str, question_id: str) -> Optional[Question]:
+        entry = await self._load(quiz_id)
+        return entry[2].get(question_id) if entry else None
+
+    def purge_expired(self) -> None:
+        def _delete(conn):
+            now = time.time()
+            conn.execute(
+                "DELETE FROM quiz_questions WHERE quiz_id IN (SELECT id FROM quizzes WHERE expires_at <= ?)",
+                (now,),
+            )
+            conn.execute("DELETE FROM quizzes WHERE expires_at <= ?", (now,))
+
+        self._db.execute(_delete)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def create_quiz_repository() -> QuizRepository:
+    backends: Dict[str, type] = {
+        "sqlite": SQLiteQuizRepository,
+        "memory": InMemoryQuizRepository,
+    }
+    if settings.QUIZ_STORE not in backends:
+        raise ValueError(f"Unknown QUIZ_STORE '{settings.QUIZ_STORE}'. Use one of: {', '.join(backends)}")
+    return backends[settings.QUIZ_STORE]()
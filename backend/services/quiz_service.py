@@ -1,22 +1,176 @@
+import asyncio
+import math
+import re
+import time
 import uuid
-import json
-from typing import List
+from typing import AsyncGenerator, List, Optional, Sequence, Tuple, Union
+from config import settings
 from services.gemini_service import GeminiService
-from models.quiz import Quiz, Question, AnswerResult
+from services.scheduling import Priority
+from services.cache import ResponseCache
+from services.quiz_repository import QuizRepository, InMemoryQuizRepository
+from services.quiz_parser import QuestionStreamParser, validate_question
+from services.retrieval_service import chunk_text
+from services.prompt_budget import estimate_tokens, prompt_budget
+from services import metrics
+from models.quiz import Quiz, Question, AnswerResult, AnswerSubmission, QuestionResult, BatchAnswerResult
+
+# Bump when the quiz prompt or parsing changes so cached questions are not reused
+QUIZ_PROMPT_VERSION = "2"
+
+_NON_WORD_RE = re.compile(r"\W+")
+
+
+def normalize_question(question: str) -> str:
+    """Key used to spot duplicate questions across retries and parallel calls"""
+    return _NON_WORD_RE.sub(" ", question.lower()).strip()
 
 class QuizService:
-    def __init__(self):
-        self.gemini = GeminiService()
-        self.quizzes = {}  # In-memory storage, replace with database in production
+    def __init__(
+        self,
+        gemini: GeminiService,
+        cache: Optional[ResponseCache] = None,
+        repository: Optional[QuizRepository] = None,
+    ):
+        self.gemini = gemini
+        self.cache = cache
+        self.repository = repository or InMemoryQuizRepository()
+
+    async def _store_quiz(self, questions: List[Question]) -> Quiz:
+        quiz_id = str(uuid.uuid4())
+        quiz = Quiz(id=quiz_id, questions=questions)
+        await self.repository.save(quiz)
+        return quiz
+
+    async def create_quiz(self, questions: List[Question]) -> Quiz:
+        """Store a quiz made of questions generated earlier, numbered from 1"""
+        return await self._store_quiz(
+            [q.model_copy(update={"id": str(i + 1)}) for i, q in enumerate(questions)]
+        )
 
-    async def generate_quiz(self, text: str, num_questions: int) -> Quiz:
+    async def generate_quiz(self, text: str, num_questions: int, fresh: bool = False) -> Quiz:
+        """Generate a quiz, reusing cached questions for identical text unless fresh is set"""
+        async for event, payload in self.stream_quiz(text, num_questions, fresh):
+            if event == "quiz":
+                return payload
+        raise ValueError("No valid questions were generated")
+
+    async def stream_quiz(
+        self, text: str, num_questions: int, fresh: bool = False
+    ) -> AsyncGenerator[Tuple[str, Union[Question, Quiz]], None]:
+        """Yield ("question", Question) as each question is ready, then ("quiz", Quiz) once stored"""
         if not text or len(text.strip()) < 50:
             raise ValueError("Text is too short to generate meaningful quiz questions")
 
+        cache_key = None
+        if self.cache:
+            cache_key = ResponseCache.make_key(
+                "quiz", text, QUIZ_PROMPT_VERSION, num_questions=num_questions
+            )
+            if not fresh:
+                cached = await self.cache.get(cache_key)
+                if cached:
+                    questions = [Question(**q) for q in cached]
+                    for question in questions:
+                        yield "question", question
+                    # Same questions, new quiz id so answers are tracked per attempt
+                    yield "quiz", await self._store_quiz(questions)
+                    return
+
+        try:
+            questions = []
+            async for question in self._generate_questions(text, num_questions):
+                questions.append(question)
+                yield "question", question
+            if not questions:
+                raise ValueError("No valid questions were generated")
+
+            quiz = await self._store_quiz(questions)
+            if cache_key:
+                await self.cache.set(cache_key, [q.model_dump() for q in questions])
+            yield "quiz", quiz
+
+        except Exception as e:
+            print(f"Error generating quiz: {str(e)}")
+            raise
+
+    async def _generate_questions(self, text: str, num_questions: int) -> AsyncGenerator[Question, None]:
+        """Generate questions, fanning large quizzes and long texts out over document sections in parallel"""
+        per_call = settings.QUIZ_QUESTIONS_PER_CALL
+        text_budget = self.text_budget(min(num_questions, per_call))
+        text_tokens = estimate_tokens(text)
+        num_sections = max(math.ceil(num_questions / per_call), math.ceil(text_tokens / text_budget))
+        if num_sections <= 1:
+            async for question in self.iter_questions(text, num_questions):
+                yield question
+            return
+
+        sections = chunk_text(text, math.ceil(len(text) / num_sections) + 1, 0)
+        # Spread questions evenly, so a short quiz over a long text still samples all of it
+        quotas = [
+            (i + 1) * num_questions // len(sections) - i * num_questions // len(sections)
+            for i in range(len(sections))
+        ]
+
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        slots = asyncio.Semaphore(settings.QUIZ_FANOUT)
+
+        async def produce(section: str, quota: int):
+            try:
+                async with slots:
+                    async for question in self.iter_questions(section, quota):
+                        await queue.put(question)
+            except Exception as e:
+                # One failed section should not sink the quiz; the top-up below covers it
+                print(f"Quiz section generation failed: {str(e)}")
+            finally:
+                await queue.put(finished)
+
+        tasks = [asyncio.create_task(produce(s, q)) for s, q in zip(sections, quotas) if q > 0]
+        seen = set()
+        asked: List[str] = []
+        try:
+            remaining = len(tasks)
+            while remaining:
+                item = await queue.get()
+                if item is finished:
+                    remaining -= 1
+                    continue
+                key = normalize_question(item.question)
+                if key in seen:
+                    continue
+                seen.add(key)
+                asked.append(item.question)
+                yield item.model_copy(update={"id": str(len(asked))})
+                if len(asked) >= num_questions:
+                    return
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Sections that failed or overlapped: ask for the shortfall from the whole text if it fits
+        # in one prompt, otherwise from the sections in turn
+        sources = [text] if text_tokens <= self.text_budget(per_call, asked) else sections
+        for source in sources:
+            missing = num_questions - len(asked)
+            if missing <= 0:
+                break
+            async for question in self.iter_questions(source, missing, asked, start_id=len(asked) + 1):
+                asked.append(question.question)
+                yield question
+
+    @classmethod
+    def text_budget(cls, num_questions: int, avoid: Sequence[str] = ()) -> int:
+        """Tokens left for the source text once the quiz instructions are in the prompt"""
+        return max(1, prompt_budget() - estimate_tokens(cls.build_prompt("", num_questions, avoid)))
+
+    @staticmethod
+    def build_prompt(text: str, num_questions: int, avoid: Sequence[str] = ()) -> str:
         prompt = (
             f"Generate a quiz with exactly {num_questions} multiple-choice questions based on the following text.\n\n"
             "IMPORTANT FORMATTING REQUIREMENTS:\n"
-            "1. Response MUST be a JSON array containing exactly {num_questions} question objects\n"
+            f"1. Response MUST be a JSON array containing exactly {num_questions} question objects\n"
             "2. Each question object MUST have these exact fields:\n"
             '   - "question": "A clear, specific question about the content"\n'
             '   - "options": ["option1", "option2", "option3", "option4"] (exactly 4 options)\n'
@@ -31,81 +185,99 @@ class QuizService:
             "5. Focus on key concepts from the text\n\n"
             "Example format:\n"
             '[\n  {\n    "question": "What is X?",\n    "options": ["A", "B", "C", "D"],\n    "correctAnswer": 2,\n    "explanation": "C is correct because..."\n  }\n]\n\n'
-            f"Text to analyze:\n{text}"
         )
-        
-        try:
-            response = await self.gemini.generate_text(prompt)
-            if not response:
-                raise ValueError("No response received from AI model")
+        if avoid:
+            prompt += (
+                "Do NOT repeat or rephrase any of these existing questions:\n"
+                + "\n".join(f"- {question}" for question in avoid)
+                + "\n\n"
+            )
+        return prompt + f"Text to analyze:\n{text}"
 
-            # Try to extract JSON from the response if it's embedded in text
-            try:
-                # First try direct JSON parsing
-                questions_data = json.loads(response)
-            except json.JSONDecodeError:
-                # If that fails, try to find a JSON array in the response
-                import re
-                json_match = re.search(r'\[\s*{[^}]*}(?:\s*,\s*{[^}]*})*\s*\]', response)
-                if not json_match:
-                    print(f"Invalid response format. Response: {response[:200]}...")
-                    raise ValueError("Could not extract valid JSON from the response")
-                questions_data = json.loads(json_match.group())
-
-            if not isinstance(questions_data, list):
-                raise ValueError("Questions data must be an array")
+    async def iter_questions(
+        self, text: str, num_questions: int, avoid: Sequence[str] = (), start_id: int = 1
+    ) -> AsyncGenerator[Question, None]:
+        """Yield validated questions as soon as each one is complete in the model's stream.
 
-            questions = []
-            for i, q_data in enumerate(questions_data):
-                # Validate required fields
-                required_fields = ["question", "options", "correctAnswer", "explanation"]
-                missing_fields = [f for f in required_fields if f not in q_data]
-                if missing_fields:
-                    raise ValueError(f"Question {i+1} is missing required fields: {missing_fields}")
-
-                # Validate options array
-                if not isinstance(q_data["options"], list) or len(q_data["options"]) != 4:
-                    raise ValueError(f"Question {i+1} must have exactly 4 options")
-
-                # Validate correctAnswer
-                if not isinstance(q_data["correctAnswer"], int) or not (0 <= q_data["correctAnswer"] <= 3):
-                    raise ValueError(f"Question {i+1} has invalid correctAnswer (must be 0-3)")
-
-                question = Question(
-                    id=str(i + 1),
-                    question=q_data["question"],
-                    options=q_data["options"],
-                    correct_answer=q_data["correctAnswer"],
-                    explanation=q_data["explanation"]
-                )
-                questions.append(question)
+        Malformed or invalid questions are dropped and only the missing number
+        is re-requested, up to QUIZ_REPAIR_ATTEMPTS times, instead of
+        regenerating the whole quiz.
+        """
+        seen = {normalize_question(q) for q in avoid}
+        asked = list(avoid)
+        produced = 0
+        for attempt in range(1 + settings.QUIZ_REPAIR_ATTEMPTS):
+            missing = num_questions - produced
+            if missing <= 0:
+                return
+            if attempt:
+                print(f"Re-requesting {missing} missing quiz question(s), attempt {attempt}")
 
-            if not questions:
-                raise ValueError("No valid questions were generated")
-
-            quiz_id = str(uuid.uuid4())
-            quiz = Quiz(id=quiz_id, questions=questions)
-            self.quizzes[quiz_id] = quiz
-            return quiz
-
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
-            raise ValueError(f"Failed to parse quiz questions: {str(e)}")
-        except Exception as e:
-            print(f"Error generating quiz: {str(e)}")
-            raise
+            parser = QuestionStreamParser()
+            with metrics.stage("prompt_build"):
+                prompt = self.build_prompt(text, missing, asked)
+            stream = self.gemini.generate_text_stream(prompt, priority=Priority.BULK)
+            parse_seconds = 0.0
+            try:
+                async for chunk in stream:
+                    parse_started = time.perf_counter()
+                    items = parser.feed(chunk)
+                    parse_seconds += time.perf_counter() - parse_started
+                    for item in items:
+                        try:
+                            question = validate_question(item, str(start_id + produced))
+                        except ValueError as e:
+                            print(f"Dropping invalid quiz question: {str(e)}")
+                            continue
+                        key = normalize_question(question.question)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        asked.append(question.question)
+                        produced += 1
+                        yield question
+                        if produced >= num_questions:
+                            return
+            finally:
+                # Stops the upstream stream early once enough questions arrived
+                await stream.aclose()
+                metrics.record_stage("response_parse", parse_seconds)
 
     async def check_answer(self, quiz_id: str, question_id: str, answer: int) -> AnswerResult:
-        quiz = self.quizzes.get(quiz_id)
-        if not quiz:
-            raise ValueError("Quiz not found")
-            
-        question = next((q for q in quiz.questions if q.id == question_id), None)
+        question = await self.repository.get_question(quiz_id, question_id)
         if not question:
+            if not await self.repository.get_quiz(quiz_id):
+                raise ValueError("Quiz not found")
             raise ValueError("Question not found")
             
         is_correct = answer == question.correct_answer
         return AnswerResult(
             correct=is_correct,
             explanation=question.explanation
-        )
\ No newline at end of file
+        )
+
+    async def check_answers(self, quiz_id: str, answers: List[AnswerSubmission]) -> BatchAnswerResult:
+        """Grade a whole submission with a single quiz lookup"""
+        quiz = await self.repository.get_quiz(quiz_id)
+        if not quiz:
+            raise ValueError("Quiz not found")
+
+        questions = {q.id: q for q in quiz.questions}
+        results = []
+        for submission in answers:
+            question = questions.get(submission.question_id)
+            if not question:
+                raise ValueError(f"Question not found: {submission.question_id}")
+            results.append(QuestionResult(
+                question_id=question.id,
+                correct=submission.answer == question.correct_answer,
+                correct_answer=question.correct_answer,
+                explanation=question.explanation
+            ))
+
+        return BatchAnswerResult(
+            quiz_id=quiz_id,
+            score=sum(1 for r in results if r.correct),
+            total=len(quiz.questions),
+            results=results
+        )
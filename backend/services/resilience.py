@@ -0,0 +1,186 @@
+import asyncio
+import math
+import random
+import re
+import time
+from typing import Optional
+from fastapi import HTTPException
+
+# Upstream exception classes (google.api_core and builtins) worth retrying; matched by name so
+# this module does not import the SDK
+_TRANSIENT_TYPES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "BadGateway", "GatewayTimeout", "DeadlineExceeded", "Aborted", "RetryError",
+    "TimeoutError", "ConnectionError",
+}
+_TRANSIENT_CODES = {429, 500, 502, 503, 504}
+# Status codes only as whole numbers, so e.g. "max 5000 tokens" is not read as a 500
+_TRANSIENT_CODE_RE = re.compile(r"\b(?:429|50[0234])\b")
+_TRANSIENT_MESSAGES = ("rate limit", "quota", "unavailable", "deadline", "timed out")
+
+
+class UpstreamUnavailableError(HTTPException):
+    def __init__(self, detail: str, retry_after: Optional[float] = None):
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after else None
+        super().__init__(status_code=503, detail=detail, headers=headers)
+
+
+class UpstreamTimeoutError(HTTPException):
+    def __init__(self, timeout: float):
+        super().__init__(
+            status_code=504,
+            detail=f"The AI model did not respond within {timeout:g} seconds. Please try again.",
+        )
+
+
+def is_transient(error: BaseException) -> bool:
+    """Rate limits, overloads, timeouts and dropped connections; not bad requests or blocked content"""
+    if isinstance(error, UpstreamUnavailableError):
+        return False  # raised locally by the limiter or breaker, retrying would only add load
+    if isinstance(error, (UpstreamTimeoutError, asyncio.TimeoutError)):
+        return True
+    if any(cls.__name__ in _TRANSIENT_TYPES for cls in type(error).__mro__):
+        return True
+    # google.api_core errors carry the HTTP status as .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and not isinstance(code, bool):
+        return code in _TRANSIENT_CODES
+    message = str(error).lower()
+    return bool(_TRANSIENT_CODE_RE.search(message)) or any(marker in message for marker in _TRANSIENT_MESSAGES)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter, so retrying clients spread out instead of syncing up"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Refills continuously at per_minute; callers reserve up front and wait off any deficit"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount (capped at capacity) and return how long to wait before using it"""
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+        return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class RateLimiter:
+    """Paces upstream calls to the provider's requests- and tokens-per-minute quotas.
+
+    Reservations are taken in arrival order, so a queue of callers is spread
+    out over time instead of bursting into 429s. A caller whose wait would be
+    longer than max_wait is rejected straight away with a Retry-After.
+    A quota of 0 disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_wait: float):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.throttled = 0
+        self.rejected = 0
+
+    async def acquire(self, tokens: int) -> None:
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay <= 0:
+            return
+
+        if delay > self.max_wait:
+            self._refund(tokens)
+            self.rejected += 1
+            raise UpstreamUnavailableError(
+                "The AI model is at its request quota. Please try again shortly.", retry_after=delay
+            )
+        self.throttled += 1
+        self.waiting += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self._refund(tokens)
+            raise
+        finally:
+            self.waiting -= 1
+
+    def _refund(self, tokens: int) -> None:
+        if self.requests:
+            self.requests.refund(1)
+        if self.tokens:
+            self.tokens.refund(tokens)
+
+
+class CircuitBreaker:
+    """Fails fast while the upstream is degraded.
+
+    After failure_threshold consecutive transient failures the circuit opens
+    and calls are rejected for reset_seconds. Then one probe call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_started: Optional[float] = None
+
+    def check(self) -> None:
+        """Raise instead of calling the upstream while the circuit is open"""
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        remaining = self.opened_at + self.reset_seconds - now
+        if self.state == self.OPEN and remaining <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # A probe that never reported back (e.g. its caller was cancelled) is replaced
+            if self._probe_started is None or now - self._probe_started > self.reset_seconds:
+                self._probe_started = now
+                return
+        self.rejected += 1
+        raise UpstreamUnavailableError(
+            "The AI model is temporarily unavailable. Please try again shortly.",
+            retry_after=max(remaining, 1.0),
+        )
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probe_started = None
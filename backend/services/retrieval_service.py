@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+from config import settings
+from services.scheduling import Priority
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Async (texts, priority) -> one vector per text, e.g. GeminiService.embed_texts
+Embedder = Callable[[Sequence[str], int], Awaitable[List[List[float]]]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for lexical scoring"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Split text into overlapping chunks, preferring paragraph and sentence boundaries"""
+    text = text.strip()
+    if not text:
+        return []
+    if len(text) <= chunk_size:
+        return [text]
+
+    overlap = max(0, min(overlap, chunk_size // 2))
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Break on the nicest boundary in the second half of the window
+            window = text[start + chunk_size // 2:end]
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + chunk_size // 2 + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of chunks"""
+
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freqs = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        if not terms:
+            return []
+
+        scores = []
+        for i, tf in enumerate(self.term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((i, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_k]
+
+
+class EmbeddingIndex:
+    """Cosine-similarity index over precomputed chunk embeddings"""
+
+    def __init__(self, vectors: List[List[float]]):
+        self.vectors = [self._normalize(v) for v in vectors]
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> List[float]:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def search(self, query_vector: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        query_vector = self._normalize(query_vector)
+        scores = [
+            (i, sum(a * b for a, b in zip(query_vector, vector)))
+            for i, vector in enumerate(self.vectors)
+        ]
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_k]
+
+
+class DocumentIndex:
+    def __init__(self, document_id: str, chunks: List[str]):
+        self.document_id = document_id
+        self.chunks = chunks
+        self.bm25 = BM25Index(chunks)
+        self.embeddings: Optional[EmbeddingIndex] = None
+
+    def search(self, query: str, top_k: int, query_vector: Optional[Sequence[float]] = None) -> List[str]:
+        """Return the top_k chunks in document order, fusing lexical and embedding ranks"""
+        candidates = top_k * 3
+        rankings = [self.bm25.search(query, candidates)]
+        if self.embeddings and query_vector is not None:
+            rankings.append(self.embeddings.search(query_vector, candidates))
+
+        # Reciprocal rank fusion keeps the two score scales comparable
+        fused = Counter()
+        for ranking in rankings:
+            for rank, (i, _) in enumerate(ranking):
+                fused[i] += 1.0 / (60 + rank)
+
+        if fused:
+            selected = [i for i, _ in fused.most_common(top_k)]
+        else:
+            # Nothing matched lexically (e.g. "summarize this"), fall back to the opening chunks
+            selected = list(range(min(top_k, len(self.chunks))))
+        return [self.chunks[i] for i in sorted(selected)]
+
+
+class RetrievalService:
+    """In-process registry of chunked, indexed documents"""
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        max_documents: int = None,
+        loader: Optional[Callable[[str], Awaitable[Optional[str]]]] = None,
+    ):
+        self.embedder = embedder
+        self.max_documents = max_documents or settings.MAX_INDEXED_DOCUMENTS
+        # Fetches a stored document's text, so evicted or pre-restart documents are re-indexed on demand
+        self.loader = loader
+        self._indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+
+    @staticmethod
+    def document_id_for(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def _build(self, document_id: str, text: str) -> DocumentIndex:
+        chunks = chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+        if not chunks:
+            raise ValueError("Document has no text to index")
+        return DocumentIndex(document_id, chunks)
+
+    async def index_document(self, text: str) -> DocumentIndex:
+        """Chunk and index text, reusing an existing index for identical content"""
+        document_id = self.document_id_for(text)
+        index = self.get(document_id)
+        if index:
+            return index
+
+        loop = asyncio.get_event_loop()
+        index = await loop.run_in_executor(None, self._build, document_id, text)
+        if self.embedder:
+            # Batched calls through the shared model client, under its quota, retries and breaker
+            index.embeddings = EmbeddingIndex(await self.embedder(index.chunks, Priority.DEFAULT))
+        self._indexes[document_id] = index
+        while len(self._indexes) > self.max_documents:
+            self._indexes.popitem(last=False)
+        return index
+
+    def get(self, document_id: str) -> Optional[DocumentIndex]:
+        index = self._indexes.get(document_id)
+        if index:
+            self._indexes.move_to_end(document_id)
+        return index
+
+    async def load(self, document_id: str) -> Optional[DocumentIndex]:
+        """The document's index, rebuilt from the loader if it is not in memory"""
+        index = self.get(document_id)
+        if index or not self.loader:
+            return index
+        text = await self.loader(document_id)
+        return await self.index_document(text) if text else None
+
+    async def retrieve(self, document_id: str, query: str, top_k: int = None) -> List[str]:
+        index = await self.load(document_id)
+        if not index:
+            raise ValueError("Document not found. Please upload it again.")
+        query_vector = None
+        if index.embeddings:
+            query_vector = (await self.embedder([query], Priority.INTERACTIVE))[0]
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, index.search, query, top_k or settings.RETRIEVAL_TOP_K, query_vector
+        )
+
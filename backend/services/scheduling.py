@@ -0,0 +1,63 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+
+
+class Priority:
+    """Lower values are admitted first when the LLM client is saturated"""
+    INTERACTIVE = 0  # chat, where a user is waiting on every token
+    DEFAULT = 1      # single summaries
+    BULK = 2         # quiz generation and other batch work
+
+
+class PriorityLimiter:
+    """Global concurrency cap that admits waiters by priority, then FIFO"""
+
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError("Concurrency limit must be at least 1")
+        self.limit = limit
+        self._available = limit
+        self._waiters = []  # heap of (priority, seq, future)
+        self._counter = itertools.count()
+
+    @property
+    def in_flight(self) -> int:
+        return self.limit - self._available
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int = Priority.DEFAULT) -> None:
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we were cancelled, pass it on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # Hand the slot straight to the next waiter
+                fut.set_result(None)
+                return
+        self._available += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = Priority.DEFAULT):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,117 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Tuple
+from config import settings
+from services.gemini_service import GeminiService
+from services.scheduling import Priority
+from services.prompt_budget import estimate_tokens
+
+
+class ChatSession:
+    """Server-side conversation state: a document plus a compacted turn history"""
+
+    def __init__(self, session_id: str, document_id: str):
+        self.id = session_id
+        self.document_id = document_id
+        self.summary = ""  # running summary of turns compacted away
+        self.turns: List[Tuple[str, str]] = []  # (question, answer)
+        # Rendered once per turn so each prompt only appends the newest turn
+        self._rendered: List[str] = []
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.lock = asyncio.Lock()
+        self.compacting = False
+
+    @staticmethod
+    def render_turn(question: str, answer: str) -> str:
+        return f"Student: {question}\nAssistant: {answer}\n"
+
+    def add_turn(self, question: str, answer: str) -> None:
+        self.turns.append((question, answer))
+        self._rendered.append(self.render_turn(question, answer))
+        self.updated_at = time.time()
+
+    def drop_oldest(self, count: int, summary: str) -> None:
+        self.turns = self.turns[count:]
+        self._rendered = self._rendered[count:]
+        self.summary = summary
+
+    def history_text(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}\n")
+        if self._rendered:
+            parts.append("Recent turns:\n" + "".join(self._rendered))
+        return "\n".join(parts)
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(r) for r in self._rendered)
+
+
+class SessionService:
+    """In-process LRU of chat sessions with idle expiry and background history compaction"""
+
+    def __init__(self, gemini: GeminiService, max_sessions: int = None, ttl_seconds: float = None):
+        self.gemini = gemini
+        self.max_sessions = max_sessions or settings.MAX_CHAT_SESSIONS
+        self.ttl_seconds = ttl_seconds or settings.CHAT_SESSION_TTL_SECONDS
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._background = set()
+
+    def create(self, document_id: str) -> ChatSession:
+        session = ChatSession(str(uuid.uuid4()), document_id)
+        self._sessions[session.id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> ChatSession:
+        session = self._sessions.get(session_id)
+        if not session or session.updated_at + self.ttl_seconds < time.time():
+            self._sessions.pop(session_id, None)
+            raise ValueError("Chat session not found or expired. Please start a new session.")
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> None:
+        if self._sessions.pop(session_id, None) is None:
+            raise ValueError("Chat session not found or expired. Please start a new session.")
+
+    def schedule_compaction(self, session: ChatSession) -> None:
+        """Summarize older turns in the background once the history passes its token budget"""
+        if session.compacting or session.history_tokens() <= settings.CHAT_HISTORY_TOKENS:
+            return
+        session.compacting = True
+        task = asyncio.create_task(self._compact(session))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _compact(self, session: ChatSession) -> None:
+        try:
+            count = len(session.turns) - settings.CHAT_KEEP_RECENT_TURNS
+            if count <= 0:
+                return
+            transcript = "".join(ChatSession.render_turn(q, a) for q, a in session.turns[:count])
+            prompt = (
+                "You maintain a running summary of a tutoring conversation about a study document. "
+                "Update the summary with the new turns below. Keep the facts, definitions and "
+                "questions the student asked, and note anything they struggled with. "
+                "Respond with the updated summary only, in at most 200 words.\n\n"
+                f"Current summary:\n{session.summary or '(none)'}\n\n"
+                f"New turns:\n{transcript}"
+            )
+            summary = await self.gemini.generate_text(prompt, priority=Priority.DEFAULT)
+            # Turns added while we were summarizing stay after the compacted ones
+            async with session.lock:
+                session.drop_oldest(count, summary.strip())
+        except Exception as e:
+            print(f"Error compacting chat session {session.id}: {str(e)}")
+        finally:
+            session.compacting = False
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
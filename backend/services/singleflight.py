@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+from config import settings
+
+T = TypeVar("T")
+
+
+def fingerprint(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The shared call runs as its own task, so one caller disconnecting does not
+    cancel it for the others; it is only cancelled when every caller has gone.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class _Broadcast:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.advanced = asyncio.Event()
+        self.positions: Dict[object, int] = {}  # live subscriber -> chunks it has consumed
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+    def advance(self, subscriber: object, position: Optional[int]) -> None:
+        if position is None:
+            self.positions.pop(subscriber, None)
+        else:
+            self.positions[subscriber] = position
+        event, self.advanced = self.advanced, asyncio.Event()
+        event.set()
+
+    def lag(self) -> int:
+        return len(self.chunks) - min(self.positions.values(), default=len(self.chunks))
+
+
+class StreamFlight:
+    """Fans one upstream stream out to every subscriber asking for the same key.
+
+    Late subscribers replay the chunks received so far, so all of them see the
+    same complete output. The upstream is paced on the slowest live subscriber:
+    it is not read further while that subscriber is max_lag chunks behind.
+    """
+
+    def __init__(self, max_lag: int = None):
+        self.max_lag = max_lag or settings.STREAM_QUEUE_SIZE
+        self._streams: Dict[str, _Broadcast] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def subscribe(
+        self, key: str, fn: Callable[[], AsyncIterator[str]]
+    ) -> AsyncGenerator[str, None]:
+        broadcast = self._streams.get(key)
+        if broadcast:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, fn))
+
+        subscriber = object()
+        broadcast.subscribers += 1
+        broadcast.advance(subscriber, 0)
+        try:
+            position = 0
+            while True:
+                while position < len(broadcast.chunks):
+                    yield broadcast.chunks[position]
+                    position += 1
+                    broadcast.advance(subscriber, position)
+                if broadcast.done:
+                    if broadcast.error:
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            broadcast.advance(subscriber, None)
+            if broadcast.subscribers == 0 and not broadcast.done:
+                broadcast.task.cancel()
+
+    async def _produce(self, key: str, broadcast: _Broadcast, fn: Callable[[], AsyncIterator[str]]) -> None:
+        stream = fn()
+        try:
+            async for chunk in stream:
+                broadcast.chunks.append(chunk)
+                broadcast.notify()
+                while broadcast.lag() >= self.max_lag:
+                    await broadcast.advanced.wait()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            # New callers start a fresh stream from here on
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            broadcast.done = True
+            broadcast.notify()
+            await stream.aclose()
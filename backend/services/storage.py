@@ -0,0 +1,48 @@
+import asyncio
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SQLitePool:
+    """Small pool of WAL-mode SQLite connections shared across worker threads"""
+
+    def __init__(self, path: str, size: int = 4):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._pool.put(conn)
+        self._size = size
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the block runs in one transaction"""
+        conn = self._pool.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def execute(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        with self.connection() as conn:
+            return fn(conn)
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run fn(conn) on a worker thread so disk I/O stays off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.execute, fn)
+
+    def close(self) -> None:
+        for _ in range(self._size):
+            self._pool.get().close()
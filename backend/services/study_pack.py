@@ -0,0 +1,362 @@
+import asyncio
+import itertools
+import json
+import math
+import time
+from typing import List, Optional
+from config import settings
+from models.document import DocumentSummary, StudyPackStatus
+from models.quiz import Question, Quiz
+from services.document_service import DocumentService
+from services.document_store import DocumentStore
+from services.quiz_service import QuizService, normalize_question
+from services.retrieval_service import RetrievalService, chunk_text
+from services.scheduling import Priority
+from services.prompt_budget import estimate_tokens
+from services.resilience import UpstreamTimeoutError, UpstreamUnavailableError, is_transient
+from services.storage import SQLitePool
+
+BUILDING = "building"
+READY = "ready"
+
+# Stage order: lower runs first across every queued document, so a new
+# upload's summary is ready before older documents' question banks grow
+INDEX, SUMMARY, QUESTIONS = 0, 1, 2
+
+# Earlier bank questions sent back as "do not repeat" with each new round
+_AVOID_QUESTIONS = 40
+
+
+class StudyPackStore:
+    """Precomputed summaries and question banks, next to the stored documents they belong to"""
+
+    def __init__(self, db_path: str = None):
+        self._db = SQLitePool(db_path or settings.DOCUMENT_DB_PATH, size=2)
+        self._db.execute(self._create_schema)
+
+    @staticmethod
+    def _create_schema(conn) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS study_packs ("
+            "document_id TEXT PRIMARY KEY, status TEXT NOT NULL, summary TEXT, "
+            "bank_target INTEGER NOT NULL, rounds INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS study_pack_questions ("
+            "document_id TEXT NOT NULL, position INTEGER NOT NULL, question TEXT NOT NULL, "
+            "served INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (document_id, position)) WITHOUT ROWID"
+        )
+
+    async def create(self, document_id: str, bank_target: int) -> bool:
+        """Start a pack for the document; False if one already exists"""
+        now = time.time()
+
+        def _insert(conn):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO study_packs (document_id, status, bank_target, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (document_id, BUILDING, bank_target, now, now),
+            )
+            return cursor.rowcount > 0
+
+        return await self._db.run(_insert)
+
+    async def status(self, document_id: str) -> Optional[StudyPackStatus]:
+        def _select(conn):
+            row = conn.execute(
+                "SELECT status, summary IS NOT NULL, bank_target FROM study_packs WHERE document_id = ?",
+                (document_id,),
+            ).fetchone()
+            if not row:
+                return None
+            size, served = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(served), 0) FROM study_pack_questions WHERE document_id = ?",
+                (document_id,),
+            ).fetchone()
+            return StudyPackStatus(
+                document_id=document_id, status=row[0], summary_ready=bool(row[1]),
+                questions=size, questions_target=row[2], questions_served=served,
+            )
+
+        return await self._db.run(_select)
+
+    async def get_summary(self, document_id: str) -> Optional[DocumentSummary]:
+        row = await self._db.run(lambda conn: conn.execute(
+            "SELECT summary FROM study_packs WHERE document_id = ?", (document_id,)
+        ).fetchone())
+        return DocumentSummary(**json.loads(row[0])) if row and row[0] else None
+
+    async def set_summary(self, document_id: str, summary: DocumentSummary) -> None:
+        await self._db.run(lambda conn: conn.execute(
+            "UPDATE study_packs SET summary = ?, updated_at = ? WHERE document_id = ?",
+            (summary.model_dump_json(), time.time(), document_id),
+        ))
+
+    async def bank_questions(self, document_id: str) -> List[str]:
+        rows = await self._db.run(lambda conn: conn.execute(
+            "SELECT question FROM study_pack_questions WHERE document_id = ? ORDER BY position",
+            (document_id,),
+        ).fetchall())
+        return [json.loads(row[0])["question"] for row in rows]
+
+    async def add_questions(self, document_id: str, questions: List[Question]) -> int:
+        """Append a round of questions; returns the bank size"""
+
+        def _insert(conn):
+            start = conn.execute(
+                "SELECT COUNT(*) FROM study_pack_questions WHERE document_id = ?", (document_id,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO study_pack_questions (document_id, position, question) VALUES (?, ?, ?)",
+                [(document_id, start + i, q.model_dump_json()) for i, q in enumerate(questions)],
+            )
+            conn.execute(
+                "UPDATE study_packs SET rounds = rounds + 1, updated_at = ? WHERE document_id = ?",
+                (time.time(), document_id),
+            )
+            return start + len(questions)
+
+        return await self._db.run(_insert)
+
+    async def mark_ready(self, document_id: str) -> None:
+        await self._db.run(lambda conn: conn.execute(
+            "UPDATE study_packs SET status = ?, updated_at = ? WHERE document_id = ?",
+            (READY, time.time(), document_id),
+        ))
+
+    async def rounds(self, document_id: str) -> int:
+        row = await self._db.run(lambda conn: conn.execute(
+            "SELECT rounds FROM study_packs WHERE document_id = ?", (document_id,)
+        ).fetchone())
+        return row[0] if row else 0
+
+    async def take_questions(self, document_id: str, count: int) -> Optional[List[Question]]:
+        """Draw count questions not served before, at random.
+
+        Once a finished bank runs out, every question becomes available
+        again. Returns None when the bank cannot supply count questions yet.
+        """
+
+        def _take(conn):
+            row = conn.execute(
+                "SELECT status FROM study_packs WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if not row:
+                return None
+            unserved, total = conn.execute(
+                "SELECT COUNT(*) - COALESCE(SUM(served), 0), COUNT(*) FROM study_pack_questions WHERE document_id = ?",
+                (document_id,),
+            ).fetchone()
+            if unserved < count:
+                if row[0] != READY or total < count:
+                    return None
+                conn.execute("UPDATE study_pack_questions SET served = 0 WHERE document_id = ?", (document_id,))
+            rows = conn.execute(
+                "SELECT position, question FROM study_pack_questions WHERE document_id = ? AND served = 0 "
+                "ORDER BY RANDOM() LIMIT ?",
+                (document_id, count),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE study_pack_questions SET served = 1 WHERE document_id = ? AND position = ?",
+                [(document_id, position) for position, _ in rows],
+            )
+            return [json.loads(question) for _, question in rows]
+
+        questions = await self._db.run(_take)
+        return [Question(**q) for q in questions] if questions is not None else None
+
+    def unfinished(self) -> List[str]:
+        rows = self._db.execute(lambda conn: conn.execute(
+            "SELECT document_id FROM study_packs WHERE status = ? ORDER BY created_at", (BUILDING,)
+        ).fetchall())
+        return [row[0] for row in rows]
+
+    def purge_orphans(self) -> None:
+        """Drop packs whose document has expired from the document store"""
+
+        def _delete(conn):
+            conn.execute("DELETE FROM study_packs WHERE document_id NOT IN (SELECT id FROM documents)")
+            conn.execute(
+                "DELETE FROM study_pack_questions WHERE document_id NOT IN (SELECT document_id FROM study_packs)"
+            )
+
+        self._db.execute(_delete)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class StudyPackService:
+    """Builds study packs in the background after an upload asks for one.
+
+    Each document's pack is a chain of stages: make sure the chunk index
+    exists, summarize, then grow a question bank one round at a time.
+    Stages wait in one priority queue shared by all documents and run at
+    bulk model priority, so interactive requests go first, every pending
+    summary comes before any bank round, and a large bank fills in last.
+    """
+
+    def __init__(
+        self,
+        store: StudyPackStore,
+        documents: DocumentStore,
+        document_service: DocumentService,
+        quiz_service: QuizService,
+        retrieval: RetrievalService,
+        workers: int = None,
+    ):
+        self.store = store
+        self.documents = documents
+        self.document_service = document_service
+        self.quiz_service = quiz_service
+        self.retrieval = retrieval
+        self.workers = workers or settings.STUDY_PACK_WORKERS
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self._tasks = []
+        # Transient failures per (stage, document_id), and retries waiting out their delay
+        self._failures = {}
+        self._retries = set()
+        self.summaries_served = 0
+        self.quizzes_served = 0
+
+    def start(self) -> None:
+        self.store.purge_orphans()
+        # Packs interrupted by a restart carry on where they stopped
+        for document_id in self.store.unfinished():
+            self._enqueue(INDEX, document_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, stage: int, document_id: str) -> None:
+        self._queue.put_nowait((stage, next(self._counter), document_id))
+
+    def _retry_later(self, stage: int, document_id: str, error: Exception) -> bool:
+        """Queue the stage again after a delay if the failure was transient; False once retries run out"""
+        if not (isinstance(error, (UpstreamUnavailableError, UpstreamTimeoutError)) or is_transient(error)):
+            return False
+        key = (stage, document_id)
+        attempt = self._failures.get(key, 0) + 1
+        if attempt > settings.STUDY_PACK_RETRIES:
+            self._failures.pop(key, None)
+            return False
+        self._failures[key] = attempt
+        headers = getattr(error, "headers", None) or {}
+        delay = max(float(headers.get("Retry-After", 0)), settings.STUDY_PACK_RETRY_DELAY * 2 ** (attempt - 1))
+
+        def retry():
+            self._retries.discard(handle)
+            self._enqueue(stage, document_id)
+
+        handle = asyncio.get_running_loop().call_later(delay, retry)
+        self._retries.add(handle)
+        return True
+
+    async def request(self, document_id: str) -> StudyPackStatus:
+        """Queue a pack for a stored document; asking again for an existing pack does nothing"""
+        if await self.store.create(document_id, settings.STUDY_PACK_QUESTIONS):
+            self._enqueue(INDEX, document_id)
+        return await self.store.status(document_id)
+
+    async def status(self, document_id: str) -> Optional[StudyPackStatus]:
+        return await self.store.status(document_id)
+
+    async def summary(self, document_id: str) -> Optional[DocumentSummary]:
+        summary = await self.store.get_summary(document_id)
+        if summary:
+            self.summaries_served += 1
+        return summary
+
+    async def take_quiz(self, document_id: str, num_questions: int) -> Optional[Quiz]:
+        """A quiz drawn from the bank without repeats, or None if the bank cannot supply one yet"""
+        questions = await self.store.take_questions(document_id, num_questions)
+        if not questions:
+            return None
+        self.quizzes_served += 1
+        return await self.quiz_service.create_quiz(questions)
+
+    async def _worker(self) -> None:
+        while True:
+            stage, _, document_id = await self._queue.get()
+            try:
+                await self._run(stage, document_id)
+                self._failures.pop((stage, document_id), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Study pack stage {stage} failed for {document_id}: {str(e)}")
+                if self._retry_later(stage, document_id, e):
+                    # Rate limited or the model is down: the pack carries on once it recovers
+                    continue
+                if stage < QUESTIONS:
+                    # A failed summary should not keep the question bank from being built
+                    self._enqueue(stage + 1, document_id)
+                else:
+                    await self.store.mark_ready(document_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, stage: int, document_id: str) -> None:
+        text = await self.documents.get_text(document_id)
+        if text is None:
+            # Expired from the document store; nothing left to build from
+            await self.store.mark_ready(document_id)
+            return
+
+        if stage == INDEX:
+            await self.retrieval.load(document_id)
+        elif stage == SUMMARY:
+            if not await self.store.get_summary(document_id):
+                summary = await self.document_service.generate_summary(text, priority=Priority.BULK)
+                await self.store.set_summary(document_id, summary)
+        else:
+            if not await self._grow_bank(document_id, text):
+                await self.store.mark_ready(document_id)
+                return
+        self._enqueue(min(stage + 1, QUESTIONS), document_id)
+
+    async def _grow_bank(self, document_id: str, text: str) -> bool:
+        """Add one round of questions; False once the bank is full or a round adds nothing"""
+        existing = await self.store.bank_questions(document_id)
+        missing = settings.STUDY_PACK_QUESTIONS - len(existing)
+        if missing <= 0:
+            return False
+        per_call = min(settings.QUIZ_QUESTIONS_PER_CALL, missing)
+        avoid = existing[-_AVOID_QUESTIONS:]
+
+        # Each round draws on the next section of the document, so the bank covers all of it
+        num_sections = math.ceil(estimate_tokens(text) / self.quiz_service.text_budget(per_call, avoid))
+        sections = chunk_text(text, math.ceil(len(text) / num_sections) + 1, 0) if num_sections > 1 else [text]
+        section = sections[await self.store.rounds(document_id) % len(sections)]
+
+        seen = {normalize_question(q) for q in existing}
+        questions = []
+        async for question in self.quiz_service.iter_questions(section, per_call, avoid):
+            key = normalize_question(question.question)
+            if key not in seen:
+                seen.add(key)
+                questions.append(question)
+        if not questions:
+            return False
+        size = await self.store.add_questions(document_id, questions)
+        return size < settings.STUDY_PACK_QUESTIONS
+
+    def stats(self) -> dict:
+        return {
+            "queued_stages": self._queue.qsize(),
+            "retrying_stages": len(self._retries),
+            "summaries_served": self.summaries_served,
+            "quizzes_served": self.quizzes_served,
+        }
+
+    def close(self) -> None:
+        self.store.close()
@@ -0,0 +1,272 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from config import settings
+from services.gemini_service import GeminiService
+from services.llm_backends import ModelBackend, StubBackend, StubUnavailableError
+from services.resilience import CircuitBreaker, UpstreamTimeoutError, UpstreamUnavailableError, is_transient
+from services.scheduling import Priority
+
+
+class ScriptedBackend(ModelBackend):
+    """Plays back outcomes in order: an exception is raised, a float hangs for that many seconds, text is returned"""
+
+    name = "scripted"
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _next(self) -> str:
+        with self._lock:
+            self.calls += 1
+            outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, float):
+            time.sleep(outcome)
+            return "late"
+        return outcome
+
+    def generate(self, prompt: str) -> str:
+        return self._next()
+
+    def stream(self, prompt: str):
+        text = self._next()
+        yield text[:2]
+        yield text[2:]
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_COALESCE", False)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 0.01)
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "LLM_RPM", 0)
+    monkeypatch.setattr(settings, "LLM_TPM", 0)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 5)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 30.0)
+
+
+@pytest.fixture
+def make_service():
+    services = []
+
+    def make(backend: ModelBackend) -> GeminiService:
+        service = GeminiService(max_workers=4, max_concurrency=4, backend=backend)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.shutdown()
+
+
+def transient() -> Exception:
+    return StubUnavailableError("503 Service Unavailable")
+
+
+def test_retries_transient_errors_then_succeeds(make_service):
+    backend = ScriptedBackend(transient(), transient(), "answer")
+    gemini = make_service(backend)
+
+    assert asyncio.run(gemini.generate_text("prompt")) == "answer"
+    assert backend.calls == 3
+    assert gemini.retries == 2
+    assert gemini.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stream_retries_before_first_chunk(make_service):
+    backend = ScriptedBackend(transient(), "streamed")
+    gemini = make_service(backend)
+
+    async def collect():
+        return "".join([chunk async for chunk in gemini.generate_text_stream("prompt")])
+
+    assert asyncio.run(collect()) == "streamed"
+    assert backend.calls == 2
+
+
+def test_gives_up_after_max_retries(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    backend = ScriptedBackend(transient(), transient(), transient(), "too late")
+    gemini = make_service(backend)
+
+    with pytest.raises(UpstreamUnavailableError) as raised:
+        asyncio.run(gemini.generate_text("prompt"))
+    assert raised.value.status_code == 503
+    assert backend.calls == 3
+
+
+def test_does_not_retry_non_transient_error(make_service):
+    backend = ScriptedBackend(ValueError("400 Invalid argument: prompt exceeds 5000 characters"), "unused")
+    gemini = make_service(backend)
+
+    with pytest.raises(ValueError, match="Invalid argument"):
+        asyncio.run(gemini.generate_text("prompt"))
+    assert backend.calls == 1
+    assert gemini.retries == 0
+    # The upstream answered, so the breaker counts it as healthy
+    assert gemini.breaker.failures == 0
+
+
+def test_transient_status_codes_match_whole_words():
+    assert is_transient(ValueError("429 Resource has been exhausted"))
+    assert is_transient(ValueError("HTTP 503: backend unavailable"))
+    assert not is_transient(ValueError("Request has 5000 tokens, limit is 4096"))
+    assert not is_transient(ValueError("Unknown document 1429"))
+
+
+def test_breaker_opens_after_threshold_and_fails_fast(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    backend = StubBackend(latency=0, chunk_delay=0, error_rate=1.0)
+    gemini = make_service(backend)
+
+    async def run():
+        for i in range(2):
+            with pytest.raises(UpstreamUnavailableError):
+                await gemini.generate_text(f"prompt {i}")
+        assert gemini.breaker.state == CircuitBreaker.OPEN
+
+        backend.error_rate = 0.0
+        with pytest.raises(UpstreamUnavailableError) as raised:
+            await gemini.generate_text("prompt 3")
+        assert "temporarily unavailable" in raised.value.detail
+        assert int(raised.value.headers["Retry-After"]) >= 1
+        assert gemini.breaker.rejected == 1
+
+    asyncio.run(run())
+
+
+def test_half_open_breaker_lets_one_probe_through(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 0.2)
+    backend = ScriptedBackend(transient(), 0.1, "after probe")
+    gemini = make_service(backend)
+
+    async def run():
+        with pytest.raises(UpstreamUnavailableError):
+            await gemini.generate_text("first")
+        assert gemini.breaker.state == CircuitBreaker.OPEN
+        await asyncio.sleep(0.21)
+
+        probe = asyncio.create_task(gemini.generate_text("probe"))
+        await asyncio.sleep(0.02)
+        assert gemini.breaker.state == CircuitBreaker.HALF_OPEN
+        # Only the probe reaches the upstream while the circuit is half-open
+        with pytest.raises(UpstreamUnavailableError):
+            await gemini.generate_text("while probing")
+        assert await probe == "late"
+        assert gemini.breaker.state == CircuitBreaker.CLOSED
+
+        assert await gemini.generate_text("closed again") == "after probe"
+        assert backend.calls == 3
+
+    asyncio.run(run())
+
+
+def test_failed_probe_reopens_breaker(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_SECONDS", 0.05)
+    gemini = make_service(ScriptedBackend(transient(), transient()))
+
+    async def run():
+        with pytest.raises(UpstreamUnavailableError):
+            await gemini.generate_text("first")
+        await asyncio.sleep(0.06)
+        with pytest.raises(UpstreamUnavailableError):
+            await gemini.generate_text("probe")
+        assert gemini.breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(run())
+
+
+def test_quota_rejection_returns_503_with_retry_after(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RPM", 1)
+    monkeypatch.setattr(settings, "LLM_QUEUE_TIMEOUT", 0.1)
+    backend = ScriptedBackend("first", "second")
+    gemini = make_service(backend)
+
+    async def run():
+        assert await gemini.generate_text("first") == "first"
+        # The next request slot is a minute away, longer than callers may queue
+        with pytest.raises(UpstreamUnavailableError) as raised:
+            await gemini.generate_text("second")
+        return raised.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert "quota" in error.detail
+    assert 1 <= int(error.headers["Retry-After"]) <= 60
+    assert backend.calls == 1
+    assert gemini.rate_limiter.rejected == 1
+
+
+def test_timeout_returns_504_without_retry(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    backend = ScriptedBackend(0.3, "unused")
+    gemini = make_service(backend)
+
+    async def run():
+        with pytest.raises(UpstreamTimeoutError) as raised:
+            await gemini.generate_text("prompt")
+        assert raised.value.status_code == 504
+        # The hung call still holds its slot until its thread returns
+        assert gemini.limiter.in_flight == 1
+        await asyncio.sleep(0.4)
+        assert gemini.limiter.in_flight == 0
+
+    asyncio.run(run())
+    assert backend.calls == 1
+
+
+def test_stream_timeout_returns_504(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    gemini = make_service(ScriptedBackend(0.3))
+
+    async def run():
+        async for _ in gemini.generate_text_stream("prompt"):
+            pass
+
+    with pytest.raises(UpstreamTimeoutError):
+        asyncio.run(run())
+
+
+def test_interactive_stream_is_admitted_before_queued_bulk_streams(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_CONCURRENT_STREAMS", 1)
+    release = threading.Event()
+    started = []
+
+    class GatedBackend(ScriptedBackend):
+        def stream(self, prompt: str):
+            started.append(prompt)
+            release.wait(5)
+            yield prompt
+
+    gemini = make_service(GatedBackend())
+
+    async def consume(prompt, priority):
+        return [chunk async for chunk in gemini.generate_text_stream(prompt, priority=priority)]
+
+    async def run():
+        holder = asyncio.create_task(consume("bulk-1", Priority.BULK))
+        while not started:
+            await asyncio.sleep(0.01)
+        queued = [asyncio.create_task(consume("bulk-2", Priority.BULK))]
+        await asyncio.sleep(0.01)
+        queued.append(asyncio.create_task(consume("chat", Priority.INTERACTIVE)))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(holder, *queued)
+
+    asyncio.run(run())
+    assert started == ["bulk-1", "chat", "bulk-2"]
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from models.quiz import AnswerSubmission, Question
+from routers import quiz
+from services.gemini_service import GeminiService
+from services.llm_backends import StubBackend
+from services.quiz_service import QuizService
+
+
+def make_question(question_id: str, correct_answer: int) -> Question:
+    return Question(
+        id=question_id,
+        question=f"Question {question_id}?",
+        options=["a", "b", "c", "d"],
+        correct_answer=correct_answer,
+        explanation="Because.",
+    )
+
+
+@pytest.fixture
+def quiz_service():
+    gemini = GeminiService(backend=StubBackend(latency=0, chunk_delay=0))
+    yield QuizService(gemini)
+    gemini.shutdown()
+
+
+@pytest.fixture
+def stored_quiz(quiz_service):
+    return asyncio.run(quiz_service.create_quiz([make_question("x", 1), make_question("y", 2)]))
+
+
+def test_check_answers_scores_each_question(quiz_service, stored_quiz):
+    result = asyncio.run(quiz_service.check_answers(stored_quiz.id, [
+        AnswerSubmission(question_id="1", answer=1),
+        AnswerSubmission(question_id="2", answer=0),
+    ]))
+    assert (result.score, result.total) == (1, 2)
+    assert [r.correct for r in result.results] == [True, False]
+
+
+def test_check_answers_rejects_repeated_question(quiz_service, stored_quiz):
+    app = FastAPI()
+    app.include_router(quiz.router, prefix="/api/quiz")
+    app.state.quiz_service = quiz_service
+    client = TestClient(app)
+
+    response = client.post("/api/quiz/check-answers", json={
+        "quiz_id": stored_quiz.id,
+        "answers": [{"question_id": "1", "answer": 1}] * 5,
+    })
+
+    assert response.status_code == 422
+    assert "more than once" in response.json()["detail"][0]["msg"]
+
+
+def test_check_answers_unknown_question(quiz_service, stored_quiz):
+    with pytest.raises(ValueError, match="Question not found"):
+        asyncio.run(quiz_service.check_answers(stored_quiz.id, [AnswerSubmission(question_id="9", answer=0)]))
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from models.quiz import Question, Quiz
+from services.quiz_repository import SQLiteQuizRepository
+
+
+def make_quiz(quiz_id: str = "quiz-1") -> Quiz:
+    return Quiz(id=quiz_id, questions=[
+        Question(id=str(i), question=f"Question {i}?", options=["a", "b", "c", "d"], correct_answer=i % 4, explanation="Because.")
+        for i in range(1, 4)
+    ])
+
+
+def test_quiz_survives_a_new_repository(tmp_path):
+    db_path = str(tmp_path / "quizzes.db")
+    writer = SQLiteQuizRepository(db_path=db_path)
+    asyncio.run(writer.save(make_quiz()))
+    writer.close()
+
+    reader = SQLiteQuizRepository(db_path=db_path)
+    try:
+        quiz = asyncio.run(reader.get_quiz("quiz-1"))
+        assert [q.id for q in quiz.questions] == ["1", "2", "3"]
+        assert quiz.questions[1].correct_answer == 2
+    finally:
+        reader.close()
+
+
+def test_expired_quiz_is_gone(tmp_path):
+    db_path = str(tmp_path / "quizzes.db")
+    repository = SQLiteQuizRepository(db_path=db_path, ttl_seconds=0.05)
+    asyncio.run(repository.save(make_quiz()))
+    time.sleep(0.1)
+    try:
+        assert asyncio.run(repository.get_quiz("quiz-1")) is None
+        repository.purge_expired()
+        rows = repository._db.execute(lambda conn: conn.execute("SELECT COUNT(*) FROM quiz_questions").fetchone()[0])
+        assert rows == 0
+    finally:
+        repository.close()
+
+
+def test_question_lookup_is_served_from_the_cache(tmp_path):
+    db_path = str(tmp_path / "quizzes.db")
+    writer = SQLiteQuizRepository(db_path=db_path)
+    asyncio.run(writer.save(make_quiz()))
+    writer.close()
+
+    repository = SQLiteQuizRepository(db_path=db_path, cache_size=1)
+    try:
+        assert asyncio.run(repository.get_question("quiz-1", "2")).correct_answer == 2
+        assert asyncio.run(repository.get_question("quiz-1", "9")) is None
+
+        # Once cached, lookups no longer touch the database
+        repository._db.execute(lambda conn: conn.execute("DELETE FROM quiz_questions"))
+        assert asyncio.run(repository.get_question("quiz-1", "3")).correct_answer == 3
+        assert asyncio.run(repository.get_question("missing", "1")) is None
+    finally:
+        repository.close()
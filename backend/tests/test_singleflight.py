@@ -0,0 +1,69 @@
+import asyncio
+
+from services.singleflight import StreamFlight
+
+
+class CountingUpstream:
+    """An endless upstream that records how far it was read and whether it was closed"""
+
+    def __init__(self):
+        self.produced = 0
+        self.closed = False
+
+    async def stream(self):
+        try:
+            while True:
+                self.produced += 1
+                yield f"chunk-{self.produced}"
+                await asyncio.sleep(0)
+        finally:
+            self.closed = True
+
+
+def test_upstream_is_paced_on_the_slowest_subscriber():
+    flight = StreamFlight(max_lag=4)
+    upstream = CountingUpstream()
+
+    async def run():
+        slow = flight.subscribe("key", upstream.stream)
+        fast = flight.subscribe("key", upstream.stream)
+        assert await slow.__anext__() == "chunk-1"
+
+        async def drain():
+            async for _ in fast:
+                pass
+
+        reader = asyncio.create_task(drain())
+        await asyncio.sleep(0.05)
+        produced = upstream.produced
+
+        assert await slow.__anext__() == "chunk-2"
+        await asyncio.sleep(0.05)
+        reader.cancel()
+        await slow.aclose()
+        return produced, upstream.produced
+
+    stalled_at, resumed_at = asyncio.run(run())
+    # The fast reader cannot pull the upstream more than max_lag ahead of the slow one
+    assert stalled_at <= 1 + 4
+    assert resumed_at == stalled_at + 1
+
+
+def test_disconnected_sole_subscriber_stops_the_upstream():
+    flight = StreamFlight(max_lag=4)
+    upstream = CountingUpstream()
+
+    async def run():
+        stream = flight.subscribe("key", upstream.stream)
+        assert await stream.__anext__() == "chunk-1"
+        await asyncio.sleep(0.05)
+        stalled_at = upstream.produced
+        assert stalled_at <= 1 + 4
+
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        return stalled_at
+
+    stalled_at = asyncio.run(run())
+    assert upstream.closed
+    assert upstream.produced == stalled_at
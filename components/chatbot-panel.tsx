@@ -24,10 +24,11 @@ interface Message {
 
 interface ChatbotPanelProps {
   text: string
+  documentId?: string
   fileName: string
 }
 
-export function ChatbotPanel({ text, fileName }: ChatbotPanelProps) {
+export function ChatbotPanel({ text, documentId, fileName }: ChatbotPanelProps) {
   const [messages, setMessages] = useState<Message[]>([
     {
       id: "1",
@@ -77,6 +78,7 @@ export function ChatbotPanel({ text, fileName }: ChatbotPanelProps) {
         await api.sendChatMessageStream(
           currentInput, 
           text,
+          documentId,
           // On chunk received
           (chunk: string) => {
             setMessages((prev) => prev.map(msg => 
@@ -102,7 +104,7 @@ export function ChatbotPanel({ text, fileName }: ChatbotPanelProps) {
         )
       } else {
         // Use regular non-streaming API
-        const response = await api.sendChatMessage(currentInput, text)
+        const response = await api.sendChatMessage(currentInput, text, documentId)
         setMessages((prev) => prev.map(msg => 
           msg.id === assistantMessageId 
             ? { ...msg, content: response.content }
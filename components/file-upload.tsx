@@ -9,17 +9,18 @@ import { Alert, AlertDescription } from "@/components/ui/alert"
 import { api } from "@/lib/api"
 
 interface FileUploadProps {
-  onFileUpload: (file: File, extractedText: string) => void
+  onFileUpload: (file: File, extractedText: string, documentId?: string) => void
 }
 
 export function FileUpload({ onFileUpload }: FileUploadProps) {
   const [isProcessing, setIsProcessing] = useState(false)
   const [error, setError] = useState<string | null>(null)
 
-  const extractTextFromPDF = async (file: File): Promise<string> => {
+  // The server keeps the extracted text; the panels only need the document_id
+  const extractTextFromPDF = async (file: File): Promise<{ text?: string; document_id: string }> => {
     try {
       const response = await api.uploadDocument(file)
-      return response.text
+      return response
     } catch (err) {
       throw new Error('Failed to extract text from document')
     }
@@ -34,8 +35,8 @@ export function FileUpload({ onFileUpload }: FileUploadProps) {
       setError(null)
 
       try {
-        const extractedText = await extractTextFromPDF(file)
-        onFileUpload(file, extractedText)
+        const { text: extractedText, document_id } = await extractTextFromPDF(file)
+        onFileUpload(file, extractedText ?? "", document_id)
       } catch (err) {
         setError("Failed to process the PDF file. Please try again.")
       } finally {
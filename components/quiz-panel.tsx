@@ -22,10 +22,11 @@ interface Question {
 
 interface QuizPanelProps {
   text: string
+  documentId?: string
   fileName: string
 }
 
-export function QuizPanel({ text, fileName }: QuizPanelProps) {
+export function QuizPanel({ text, documentId, fileName }: QuizPanelProps) {
   const [quiz, setQuiz] = useState<Question[] | null>(null)
   const [isGenerating, setIsGenerating] = useState(false)
   const [currentQuestionIndex, setCurrentQuestionIndex] = useState(0)
@@ -39,7 +40,7 @@ export function QuizPanel({ text, fileName }: QuizPanelProps) {
     setIsGenerating(true)
     setError(null)
     try {
-      const response = await api.generateQuiz(text, numQuestions)
+      const response = await api.generateQuiz(text, numQuestions, documentId)
       if (!response.questions || !Array.isArray(response.questions)) {
         throw new Error('Invalid quiz format received from server')
       }
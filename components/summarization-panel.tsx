@@ -10,10 +10,11 @@ import { api } from "@/lib/api"
 
 interface SummarizationPanelProps {
   text: string
+  documentId?: string
   fileName: string
 }
 
-export function SummarizationPanel({ text, fileName }: SummarizationPanelProps) {
+export function SummarizationPanel({ text, documentId, fileName }: SummarizationPanelProps) {
   const [isGenerating, setIsGenerating] = useState(false)
   const [summary, setSummary] = useState<{
     quick_notes: string[]
@@ -26,7 +27,7 @@ export function SummarizationPanel({ text, fileName }: SummarizationPanelProps)
     setIsGenerating(true)
     setError(null)
     try {
-      const summary = await api.generateSummary(text)
+      const summary = await api.generateSummary(text, documentId)
       setSummary(summary)
     } catch (error) {
       const message = error instanceof Error ? error.message : 'Failed to generate summary'
@@ -18,13 +18,14 @@ export const api = {
     return response.json();
   },
 
-  async generateSummary(text: string) {
+  // Uploaded documents are stored server-side, so a documentId avoids resending the text
+  async generateSummary(text: string, documentId?: string) {
     const response = await fetch(`${API_BASE_URL}/documents/summarize`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ text }),
+      body: JSON.stringify(documentId ? { document_id: documentId } : { text }),
     });
     
     if (!response.ok) {
@@ -36,13 +37,14 @@ export const api = {
   },
 
   // Chat endpoints
-  async sendChatMessage(content: string, context: string) {
+  // With a documentId the server retrieves the relevant chunks itself, so the full text is not resent
+  async sendChatMessage(content: string, context: string, documentId?: string) {
     const response = await fetch(`${API_BASE_URL}/chat/message`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ content, context }),
+      body: JSON.stringify(documentId ? { content, document_id: documentId } : { content, context }),
     });
     
     if (!response.ok) {
@@ -53,13 +55,13 @@ export const api = {
   },
 
   // Streaming chat endpoint
-  async sendChatMessageStream(content: string, context: string, onChunk: (chunk: string) => void, onDone: () => void, onError: (error: string) => void) {
+  async sendChatMessageStream(content: string, context: string, documentId: string | undefined, onChunk: (chunk: string) => void, onDone: () => void, onError: (error: string) => void) {
     const response = await fetch(`${API_BASE_URL}/chat/message/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ content, context }),
+      body: JSON.stringify(documentId ? { content, document_id: documentId } : { content, context }),
     });
     
     if (!response.ok) {
@@ -107,13 +109,13 @@ export const api = {
 
 
   // Quiz endpoints
-  async generateQuiz(text: string, numQuestions: number = 5) {
+  async generateQuiz(text: string, numQuestions: number = 5, documentId?: string) {
     const response = await fetch(`${API_BASE_URL}/quiz/generate`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ text, num_questions: numQuestions }),
+      body: JSON.stringify({ ...(documentId ? { document_id: documentId } : { text }), num_questions: numQuestions }),
     });
     
     if (!response.ok) {
@@ -124,6 +126,61 @@ export const api = {
     return response.json();
   },
 
+  // Streaming quiz endpoint: questions arrive one by one, then the quiz id
+  async generateQuizStream(text: string, documentId: string | undefined, numQuestions: number, onQuestion: (question: any) => void, onDone: (quizId: string) => void, onError: (error: string) => void) {
+    const response = await fetch(`${API_BASE_URL}/quiz/generate/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ ...(documentId ? { document_id: documentId } : { text }), num_questions: numQuestions }),
+    });
+    
+    if (!response.ok) {
+      throw new Error('Failed to generate quiz');
+    }
+
+    const reader = response.body?.getReader();
+    if (!reader) {
+      throw new Error('Failed to get response reader');
+    }
+
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    try {
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        
+        for (const line of lines) {
+          if (line.startsWith('data: ')) {
+            try {
+              const data = JSON.parse(line.slice(6));
+              if (data.type === 'question') {
+                onQuestion(data.question);
+              } else if (data.type === 'done') {
+                onDone(data.quiz_id);
+                return;
+              } else if (data.type === 'error') {
+                onError(data.message);
+                return;
+              }
+            } catch (e) {
+              // Ignore JSON parse errors for incomplete chunks
+            }
+          }
+        }
+      }
+    } finally {
+      reader.releaseLock();
+    }
+  },
+
   async checkQuizAnswer(quizId: string, questionId: string, answer: number) {
     const response = await fetch(`${API_BASE_URL}/quiz/check-answer`, {
       method: 'POST',
@@ -139,4 +196,20 @@ export const api = {
     
     return response.json();
   },
+
+  async checkQuizAnswers(quizId: string, answers: { question_id: string; answer: number }[]) {
+    const response = await fetch(`${API_BASE_URL}/quiz/check-answers`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ quiz_id: quizId, answers }),
+    });
+    
+    if (!response.ok) {
+      throw new Error('Failed to check answers');
+    }
+    
+    return response.json();
+  },
 };
\ No newline at end of file